@@ -0,0 +1,78 @@
+# Benchmark: moving a scan of frames to another process and back (run from the repository root)
+#   Queue:  frames are pickled through a multiprocessing.Queue in both directions
+#   Shared: frames are copied into SharedFrameRing slots, the queues only carry references
+
+import os
+import sys
+from multiprocessing import Process, Queue
+from timeit import default_timer
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vquit.sharedframes import SharedFrameRing
+
+# Frames of a single scan (8 cameras)
+n_frames = 8
+shape = (2560, 2560, 3)
+runs = 5
+
+
+# Return every frame that comes in (as the analysis helpers return their output)
+def Echo(jobs, results, inputFrames, outputFrames):
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        (dataID, frame, slot) = job
+        if inputFrames is not None:
+            frame = outputFrames.Write(slot, inputFrames.Read(frame))
+        results.put((dataID, frame))
+
+
+def Scan(jobs, results, frames, inputFrames, outputFrames):
+    start = default_timer()
+    for dataID in range(0, len(frames)):
+        frame = frames[dataID]
+        slot = None
+        if inputFrames is not None:
+            slot = inputFrames.Next()
+            frame = inputFrames.Write(slot, frame)
+        jobs.put((dataID, frame, slot))
+
+    returned = [None] * len(frames)
+    for _ in range(0, len(frames)):
+        (dataID, frame) = results.get()
+        returned[dataID] = frame if outputFrames is None else outputFrames.Read(frame)
+    return default_timer() - start, returned
+
+
+if __name__ == '__main__':
+    frames = [np.random.randint(0, 256, shape, dtype=np.uint8) for _ in range(0, n_frames)]
+    slotBytes = frames[0].nbytes
+
+    print("Transport of " + str(n_frames) + " frames of " + "x".join(str(size) for size in shape) + " (" +
+          "{0:.0f}".format(n_frames * slotBytes / 1000000) + " MB per direction, best of " + str(runs) + ")")
+    for name, shared in [("Queue", False), ("Shared", True)]:
+        inputFrames = SharedFrameRing(n_frames, slotBytes) if shared else None
+        outputFrames = SharedFrameRing(n_frames, slotBytes) if shared else None
+        jobs = Queue()
+        results = Queue()
+        worker = Process(target=Echo, args=(jobs, results, inputFrames, outputFrames))
+        worker.start()
+
+        times = []
+        for run in range(0, runs):
+            duration, returned = Scan(jobs, results, frames, inputFrames, outputFrames)
+            assert all(np.array_equal(frames[i], returned[i]) for i in range(0, n_frames))
+            times.append(duration)
+            del returned
+
+        jobs.put(None)
+        worker.join()
+        for ring in [inputFrames, outputFrames]:
+            if ring is not None:
+                ring.Close()
+                ring.Unlink()
+
+        print("{0:<8}{1:8.1f} ms per scan".format(name, min(times) * 1000))
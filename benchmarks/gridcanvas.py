@@ -0,0 +1,51 @@
+# Micro-benchmark: combining the frames of a scan into the preview/archive grid (run from the repository root)
+#   Stack:  frames are stacked into a new grid with hstack/vstack (Image.Grid without canvas)
+#   Canvas: frames are rotated straight into their tile of a SharedGridCanvas, the grid needs no extra copy
+
+import os
+import sys
+from timeit import repeat
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vquit.imageprocessing import Image
+from vquit.sharedframes import SharedGridCanvas
+
+Image = Image()
+
+# Frames of a single scan (8 cameras)
+n_frames = 8
+height = 2560
+width = 2560
+runs = 5
+
+demosaiced = [np.random.randint(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(0, n_frames)]
+frames = [np.empty((width, height, 3), dtype=np.uint8) for _ in range(0, n_frames)]
+canvas = SharedGridCanvas(Image.GridLayout, width * height * 3 * n_frames)
+
+
+def Stack():
+    for i in range(0, n_frames):
+        Image.Orient(demosaiced[i], "Rotate90", dst=frames[i])
+    return Image.Grid(frames)
+
+
+def Canvas():
+    tiles = [Image.Orient(demosaiced[i], "Rotate90", dst=canvas.Tile(i, (width, height, 3), np.uint8))
+             for i in range(0, n_frames)]
+    return Image.Grid(tiles, canvas=canvas)
+
+
+try:
+    # Both grids must hold the same images
+    assert np.array_equal(Stack(), Canvas())
+
+    print("Rotate " + str(n_frames) + " frames " + str(width) + "x" + str(height) + " into a grid (best of 5, " + str(
+        runs) + " runs)")
+    for name, function in [("Stack", Stack), ("Canvas", Canvas)]:
+        result = min(repeat(function, number=runs, repeat=5)) / runs
+        print("{0:<8}{1:8.2f} ms per scan".format(name, result * 1000))
+finally:
+    canvas.Close()
+    canvas.Unlink()
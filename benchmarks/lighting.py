@@ -0,0 +1,86 @@
+# Benchmark: lighting time per scan on the simulated Raspberry (run from the repository root)
+#   Every product in VQuIT_Database.json is scanned like mainProcess does: select lighting, kickstart, light and expose
+#   every group of cameras for the real and the simulated cameras, back to idle lights
+#   Cold: first scan of a product (scenes are compiled and stored on the Pi) | Warm: the same product again
+#   Network latency is the round-trip of a single pigpio command (VQuIT_Config.json>Raspberry>Simulation>Latency)
+
+import os
+import sys
+from timeit import default_timer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vquit.filemanagement import Configuration, ProductData
+from vquit.raspberry import RaspberryPi
+
+latencies = [0, 0.0005, 0.002]
+
+# (name, scenes enabled, settling mode, grouping mode)
+variants = [("Per pin", 0, "Fixed", "Off"),
+            ("Scenes", 1, "Fixed", "Off"),
+            ("Scenes + grouping", 1, "Fixed", "Identical"),
+            ("Scenes + grouping + feedback", 1, "Feedback", "Identical")]
+
+
+# Configuration with the simulated Raspberry and the settings of a variant
+class BenchmarkConfiguration(Configuration):
+    def __init__(self, latency, scenes, settling, grouping):
+        self.latency = latency
+        self.scenes = scenes
+        self.settling = settling
+        self.grouping = grouping
+
+    def Get(self, category):
+        data = Configuration.Get(self, category)
+        if category == "Lighting":
+            data["Scenes"]["Enabled"] = self.scenes
+            data["Settling"]["Mode"] = self.settling
+            data["Settling"]["FeedbackPin"] = 21
+            data["Grouping"]["Mode"] = self.grouping
+        elif category == "Raspberry":
+            data["Simulation"]["Mode"] = "On"
+            data["Simulation"]["Latency"] = self.latency
+            data["Simulation"]["DaemonRunning"] = 1
+        return data
+
+    def Update(self, category, keys, value):
+        pass
+
+
+# Lighting of a single scan, returns the duration and the number of pigpio commands
+def Scan(rpi, productInfo):
+    commands = rpi.gpio.commands
+    start = default_timer()
+
+    rpi.SetLightingConfig(productInfo)
+    rpi.KickstartLights()
+    for capture in range(0, 2):
+        for group in rpi.ScheduleCameras(list(range(0, rpi.n_camera))):
+            rpi.SetCameraLighting(group, 1).result()
+            rpi.SetCameraLighting(group, 0)
+    rpi.IdleLights().result()
+
+    return default_timer() - start, rpi.gpio.commands - commands
+
+
+database = ProductData()
+products = [database.GetProductInfo(productName=name) for name in database.GetProductList()]
+
+results = []
+for latency in latencies:
+    for (name, scenes, settling, grouping) in variants:
+        rpi = RaspberryPi(Config_module=BenchmarkConfiguration(latency, scenes, settling, grouping),
+                          TerminationCheck=lambda: 0)
+
+        cold = [Scan(rpi, product) for product in products]
+        warm = [Scan(rpi, product) for product in products]
+        rpi.Disconnect(0)
+
+        results.append((latency, name, cold, warm))
+
+print("\nLighting per scan, average of " + str(len(products)) + " products")
+print("{0:<10}{1:<32}{2:>12}{3:>12}{4:>16}".format("Latency", "Variant", "Cold", "Warm", "Commands warm"))
+for (latency, name, cold, warm) in results:
+    print("{0:<10}{1:<32}{2:>9.1f} ms{3:>9.1f} ms{4:>16.1f}".format(
+        "{0:.1f} ms".format(latency * 1000), name, sum(time for time, commands in cold) / len(cold) * 1000,
+        sum(time for time, commands in warm) / len(warm) * 1000,
+        sum(commands for time, commands in warm) / len(warm)))
@@ -0,0 +1,65 @@
+# Micro-benchmark: BayerRG8 vs BayerRG12Packed capture path (run from the repository root)
+#   8 bit:  cvtColor -> rotate into preallocated frames
+#   12 bit: unpack into 16 bit -> cvtColor -> rotate into preallocated frames
+#   Wire bytes are the payload size of a single frame (excluding GigE Vision packet overhead)
+
+import os
+import sys
+from timeit import repeat
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vquit.imageprocessing import Image
+
+Image = Image()
+
+# Frame size of a single camera
+height = 2560
+width = 2560
+runs = 20
+
+raw8 = np.random.randint(0, 256, (height, width), dtype=np.uint8)
+packed = np.random.randint(0, 256, (int(height * width * 3 / 2),), dtype=np.uint8)
+
+unpacked = np.empty((height, width), dtype=np.uint16)
+nibbles = np.empty((int(height * width / 2),), dtype=np.uint8)
+demosaiced8 = np.empty((height, width, 3), dtype=np.uint8)
+demosaiced16 = np.empty((height, width, 3), dtype=np.uint16)
+frame8 = np.empty((width, height, 3), dtype=np.uint8)
+frame16 = np.empty((width, height, 3), dtype=np.uint16)
+
+
+def Reference(data):
+    # Straightforward per pixel pair unpacking
+    data = data.reshape(-1, 3).astype(np.uint16)
+    even = (data[:, 0] << 8) | ((data[:, 1] & 0x0F) << 4)
+    odd = (data[:, 2] << 8) | (data[:, 1] & 0xF0)
+    return np.stack([even, odd], axis=1).reshape(height, width)
+
+
+def Path8():
+    Image.Demosaic(raw8, "RG", dst=demosaiced8)
+    return Image.Orient(demosaiced8, "Rotate90", dst=frame8)
+
+
+def Unpack():
+    return Image.Unpack12Packed(packed, unpacked, nibbles)
+
+
+def Path12():
+    Image.Unpack12Packed(packed, unpacked, nibbles)
+    Image.Demosaic(unpacked, "RG", dst=demosaiced16)
+    return Image.Orient(demosaiced16, "Rotate90", dst=frame16)
+
+
+# Vectorized unpacking must match the reference
+assert np.array_equal(Unpack(), Reference(packed))
+
+print("Capture path " + str(width) + "x" + str(height) + " (best of 5, " + str(runs) + " runs)")
+for name, function, wireBytes in [("BayerRG8", Path8, raw8.nbytes),
+                                  ("BayerRG12Packed (unpack only)", Unpack, packed.nbytes),
+                                  ("BayerRG12Packed", Path12, packed.nbytes)]:
+    result = min(repeat(function, number=runs, repeat=5)) / runs
+    print("{0:<32}{1:7.2f} ms | {2:5.2f} MB on the wire | {3:6.1f} frames/s".format(
+        name, result * 1000, wireBytes / 1000000, 1 / result))
@@ -0,0 +1,65 @@
+# Micro-benchmark: demosaic + rotation of the capture path (run from the repository root)
+#   old:       cvtColor -> transpose -> flip (new array per step)
+#   new:       cvtColor -> rotate into preallocated frames
+#   transpose: cvtColor -> transpose into preallocated frames (camera mirrors with ReverseX/ReverseY)
+
+import os
+import sys
+from timeit import repeat
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vquit.imageprocessing import Image
+
+Image = Image()
+
+# Frame size of a single camera
+height = 2560
+width = 2560
+runs = 50
+
+raw = np.random.randint(0, 256, (height, width), dtype=np.uint8)
+demosaiced = np.empty((height, width, 3), dtype=np.uint8)
+frame = np.empty((width, height, 3), dtype=np.uint8)
+
+
+def OldPath():
+    image = cv2.cvtColor(raw, cv2.COLOR_BayerRG2RGB)
+    image = cv2.transpose(image)
+    return cv2.flip(image, flipCode=1)
+
+
+def NewPath():
+    Image.Demosaic(raw, "RG", dst=demosaiced)
+    return Image.Orient(demosaiced, "Rotate90", dst=frame)
+
+
+def SensorFlipPath():
+    Image.Demosaic(raw, "GB", dst=demosaiced)
+    return Image.Orient(demosaiced, "Transpose", dst=frame)
+
+
+def RotationOnly(operation):
+    def Run():
+        return Image.Orient(demosaiced, operation, dst=frame)
+    return Run
+
+
+def OldRotationOnly():
+    return cv2.flip(cv2.transpose(demosaiced), flipCode=1)
+
+
+# Both paths must produce the same image
+assert np.array_equal(OldPath(), NewPath())
+
+print("Demosaic + rotate " + str(width) + "x" + str(height) + " (best of 5, " + str(runs) + " runs)")
+for name, function in [("transpose + flip", OldPath),
+                       ("rotate (dst)", NewPath),
+                       ("transpose only (dst)", SensorFlipPath),
+                       ("rotation only: transpose + flip", OldRotationOnly),
+                       ("rotation only: rotate (dst)", RotationOnly("Rotate90")),
+                       ("rotation only: transpose (dst)", RotationOnly("Transpose"))]:
+    result = min(repeat(function, number=runs, repeat=5)) / runs
+    print("{0:<34}{1:.2f} ms".format(name, result * 1000))
@@ -0,0 +1,70 @@
+# Benchmark: time spent switching camera lights per settling mode (run from the repository root)
+#   Uses the simulated Raspberry (VQuIT_Config.json>Raspberry>Simulation) with the lighting of every product in
+#   VQuIT_Database.json, every camera switches its lights on and off once per product like a scan does
+#   Fixed:      FixedDelay after every switch
+#   Feedback:   wait for the confirmation pin of the light driver
+#   Calibrated: wait for the measured settle time of the slowest light of the scene
+
+import os
+import sys
+import tempfile
+from timeit import default_timer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vquit.filemanagement import Configuration, ProductData
+from vquit.raspberry import RaspberryPi
+
+# Confirmation pin of the simulated light driver and rise time of the simulated lights (seconds)
+feedbackPin = 21
+settleTimes = {"6": 0.004, "16": 0.012, "26": 0.008, "5": 0.002}
+runs = 3
+
+
+# Calibration results of this run (the settle times of the tool itself are left alone)
+settleTimesFile = os.path.join(tempfile.mkdtemp(), "SettleTimes.json")
+
+
+# Configuration with the simulated Raspberry and a settling mode
+class BenchmarkConfiguration(Configuration):
+    def __init__(self, mode):
+        self.mode = mode
+
+    def Get(self, category):
+        data = Configuration.Get(self, category)
+        if category == "Lighting":
+            data["Settling"]["Mode"] = self.mode
+            data["Settling"]["FeedbackPin"] = feedbackPin
+            data["Settling"]["File"] = settleTimesFile
+        elif category == "Raspberry":
+            data["Simulation"]["Mode"] = "On"
+            data["Simulation"]["SettleTimes"] = settleTimes
+        return data
+
+
+database = ProductData()
+products = [database.GetProductInfo(productName=name) for name in database.GetProductList()]
+
+print("Switching lights of " + str(len(products)) + " products (best of " + str(runs) + ")")
+for mode in ["Fixed", "Feedback", "Calibrated"]:
+    config = BenchmarkConfiguration(mode)
+    rpi = RaspberryPi(Config_module=config, TerminationCheck=lambda: 0)
+
+    results = []
+    for run in range(0, runs):
+        switches = 0
+        start = default_timer()
+        for product in products:
+            rpi.SetLightingConfig(product)
+            for cameraID in range(0, rpi.n_camera):
+                rpi.SetCameraLighting(cameraID, 1).result()
+                rpi.SetCameraLighting(cameraID, 0).result()
+                switches += 2
+        results.append(default_timer() - start)
+
+    rpi.Disconnect(0)
+    result = min(results)
+    print("{0:<12}{1:8.1f} ms | {2:6.2f} ms per switch".format(mode, result * 1000, result / switches * 1000))
+
+if os.path.isfile(settleTimesFile):
+    os.remove(settleTimesFile)
+os.rmdir(os.path.dirname(settleTimesFile))
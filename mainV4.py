@@ -19,7 +19,7 @@ def mainProcess(communication_Vars):
     # Extract parameters
     (SendImages, GetImages, GetProductID, UpdateToolState, GUI_ResetProgressbar, GUI_IncreaseProgressbar,
      GUI_UpdatePreviewWindow,
-     UpdateTerminationFlag, SetFinishedFlag) = communication_Vars
+     UpdateTerminationFlag, SetFinishedFlag, GridCanvas) = communication_Vars
 
     # Import custom module to extract data from config file
     from vquit import Configuration, OpenCV, Timer, Image, RaspberryPi, ImageAcquirer, ProductData, ImageData
@@ -44,8 +44,20 @@ def mainProcess(communication_Vars):
                      TerminationCheck=UpdateTerminationFlag)  # Communicate with Raspberry Pi over ethernet
 
     # Start image acquirers
-    IA = ImageAcquirer(IO.SetCameraLighting, Config_module=Config,
-                       Warnings_module=warnings)  # Used to retrieve data from the cameras
+    IA = ImageAcquirer(IO.SetCameraLighting, Config_module=Config, Warnings_module=warnings,
+                       ScheduleCameras=IO.ScheduleCameras)  # Used to retrieve data from the cameras
+
+    # Grids of the original and processed images are filled in place (cameras and helpers write into their tile)
+    originalCanvas = GridCanvas("Original")
+    processedCanvas = GridCanvas("Processed")
+    IA.SetOutputCanvas(originalCanvas)
+
+    # Images in a canvas are copied before they are queued, the queue pickles them later on its feeder thread while
+    # the next scan may already be written into the canvas
+    def QueueCopy(image, canvas):
+        if canvas is not None and canvas.Contains(image):
+            return image.copy()
+        return image
 
     # Loop this process until termination is called
     terminationFlag = 0
@@ -58,8 +70,8 @@ def mainProcess(communication_Vars):
         # Check for termination call
         terminationFlag = UpdateTerminationFlag()
 
-        # Check thermal status of cameras
-        if IA.thermalCondition() is "Critical":
+        # Check thermal status of cameras (cached, sampled in the background)
+        if IA.thermalCondition() == "Critical":
             terminationFlag = 1
             terminationMessage = "Critical camera temperatures"
 
@@ -77,17 +89,21 @@ def mainProcess(communication_Vars):
             acode, sn = GetProductID()
             productInfo = ProductData.GetProductInfo(acode=acode)
 
-            # Set camera and lighting settings based on acode
-            IA.SetCameraConfig(productInfo)
+            # Set camera and lighting settings based on acode (lighting is compiled while the cameras are configured)
             IO.SetLightingConfig(productInfo)
+            IA.SetCameraConfig(productInfo)
 
             # Fetch images
             FetchTimer.Start()
             IO.KickstartLights()
-            fetchedImages = [IA.RequestFrame(iteration) for iteration in range(0, len(IA.GigE))]
+            fetchedImages = IA.Capture(range(0, len(IA.GigE)), tiles=range(0, len(IA.GigE)))
+            failedCameras = IA.fetchReport.Failed()
+            print(IA.fetchReport.Summary())
 
             # Simulates 4 additional cameras
-            fetchedImagesSim = [IA.RequestFrame(iteration) for iteration in range(0, len(IA.GigE))]
+            fetchedImagesSim = IA.Capture(range(0, len(IA.GigE)), tiles=range(len(IA.GigE), 2 * len(IA.GigE)))
+            failedCameras += [camNr + len(IA.GigE) for camNr in IA.fetchReport.Failed()]
+            print(IA.fetchReport.Summary())
 
             for image in fetchedImagesSim:
                 fetchedImages.append(image)
@@ -100,24 +116,53 @@ def mainProcess(communication_Vars):
             # Set lights in idle mode
             IO.IdleLights()
 
-            # Send original images to GUI
-            fetchedGrid = Image.Grid(fetchedImages)
-            GUI_UpdatePreviewWindow(fetchedGrid)
-
-            # Update progressbar
-            GUI_IncreaseProgressbar(20)
-
-            # Send images to helpers
-            SendImages(fetchedImages)
-
-            # Request processed images from helpers
-            FXTimer.Start()
-            processedImages = GetImages()
-            print("Process time: ", "{0:.3f}".format(FXTimer.Stop()), "s")
+            # Incomplete scans are not processed or saved
+            if len(failedCameras) > 0:
+                warnings.warn("Scan of " + str(sn) + " aborted, no image from camera(s) " + ", ".join(
+                    [str(camNr) for camNr in failedCameras]))
+                continue
+
+            if IA.rawTransport:
+                # Send raw images to helpers together with the orientation (bayer pattern & rotation) of their camera
+                orientations = [IA.Orientation(camNr % len(IA.GigE)) for camNr in range(0, len(fetchedImages))]
+                SendImages(fetchedImages, orientations)
+
+                # Request processed and converted original images from helpers
+                FXTimer.Start()
+                processedImages, originalImages = GetImages(includeOriginals=True)
+                print("Process time: ", "{0:.3f}".format(FXTimer.Stop()), "s")
+
+                # Originals are only returned through shared memory, convert the others from the raw frames
+                for dataID in range(0, len(originalImages)):
+                    if originalImages[dataID] is None:
+                        (pattern, operation) = orientations[dataID]
+                        originalImages[dataID] = Image.Orient(Image.Demosaic(fetchedImages[dataID], pattern), operation)
+
+                # Send original images to GUI (preview is always 8 bit)
+                fetchedGrid = Image.Grid(originalImages, canvas=originalCanvas)
+                GUI_UpdatePreviewWindow(QueueCopy(Image.To8Bit(fetchedGrid), originalCanvas))
+
+                # Update progressbar
+                GUI_IncreaseProgressbar(20)
+            else:
+                # Send original images to GUI (preview is always 8 bit)
+                fetchedGrid = Image.Grid(fetchedImages, canvas=originalCanvas)
+                GUI_UpdatePreviewWindow(QueueCopy(Image.To8Bit(fetchedGrid), originalCanvas))
+
+                # Update progressbar
+                GUI_IncreaseProgressbar(20)
+
+                # Send images to helpers
+                SendImages(fetchedImages)
+
+                # Request processed images from helpers
+                FXTimer.Start()
+                processedImages = GetImages()
+                print("Process time: ", "{0:.3f}".format(FXTimer.Stop()), "s")
 
             # Send image to GUI
-            processedGrid = Image.Grid(processedImages)
-            GUI_UpdatePreviewWindow(processedGrid)
+            processedGrid = Image.Grid(processedImages, canvas=processedCanvas)
+            GUI_UpdatePreviewWindow(QueueCopy(processedGrid, processedCanvas))
 
             jsonObject, filename = ImageData.JsonfyProductInfo(productInfo, sn)
             ImageData.WriteImageInfo(jsonObject)
@@ -136,6 +181,13 @@ def mainProcess(communication_Vars):
                 IO.IdleLights()
                 idleLights = True
 
+            # Stream binned frames to the GUI so products can be positioned (scans switch back to full resolution)
+            if IA.previewEnabled:
+                previewImages = IA.RequestPreviewFrames()
+                if previewImages is not None:
+                    # Simulated cameras show the same preview (frames are dropped while the GUI is still busy)
+                    GUI_UpdatePreviewWindow(Image.To8Bit(Image.Grid(previewImages + previewImages)), skipWhenBusy=True)
+
         # Run exit code
         else:
             if terminationMessage is None:
@@ -154,7 +206,7 @@ def mainProcess(communication_Vars):
     SetFinishedFlag()
 
 
-# Image processing function run on children
+# Image processing function run on children (persistent pool started at launch, see Helpers.StartAnalysisPool)
 def analysisProcess(communication_Vars):
     from vquit import Configuration, Image, OpenCV
 
@@ -168,9 +220,7 @@ def analysisProcess(communication_Vars):
     CV = OpenCV()
 
     # Extract parameters
-    (CheckTimeout, GUI_IncreaseProgressbar, imagesIn_Vars, SendProcessedData, SetIdleAnalysisHelpers,
-     UpdateTerminationFlag) = communication_Vars
-    (imagesInLock, imagesIn) = imagesIn_Vars
+    (GUI_IncreaseProgressbar, imagesIn, ReadImage, SendProcessedData, OutputTile, preload) = communication_Vars
 
     # Color correction values
     ccTable = []
@@ -180,84 +230,76 @@ def analysisProcess(communication_Vars):
                         ccData[i]["ColorCorrection"]["Green"],
                         ccData[i]["ColorCorrection"]["Blue"]])
 
-    # Start idle timer
-    from vquit import Timer
-    IdleTimer = Timer()
-    IdleTimer.Start()
-
-    # Loop this process until termination is called
-    terminationFlag = 0
+    # Import packages and run the processing chain once before the first scan comes in
+    if preload:
+        np = Image.ImportNumpy()
+        Image.ImportOpenCV()
+        try:
+            Image.ImportScipy(ndimageOnly=True)
+        except ImportError as error:
+            print("Helper could not preload scipy (" + str(error) + ")")
+        CV.ImportOpenCV()
+        CV.ImportNumpy()
+
+        warmup = np.zeros((64, 64, 3), dtype=np.uint8)
+        CV.EdgeDetection(Image.Blur(Image.Gray(Image.NoiseReduction(Image.ColorCorrection(warmup, [1, 1, 1])))))
+
+    # Process images until the sentinel (None) is received
     terminationMessage = None
-    SetIdleAnalysisHelpers(1)  # Increase available helpers by 1
-    while terminationFlag == 0:
-        # Check for termination call
-        terminationFlag = UpdateTerminationFlag()
-
-        # Check for timeout
-        if CheckTimeout(IdleTimer.Stop()) is True:
-            terminationFlag = 1
-            terminationMessage = "Timeout reached"
-
-        # Run normal loop
-        if terminationFlag == 0:
-            # Reset image
-            image = None
-
-            # Check for new image
-            with imagesInLock:
-                if imagesIn.empty() is False:
-                    [dataID, image] = imagesIn.get()
-
-            # Process new image if found
-            if image is not None:
-                # Decrease available helpers by 1
-                SetIdleAnalysisHelpers(-1)
-
-                # Temporary code in order to show demo with 4 virtual cameras
-                if dataID <= 3:
-                    tempSimDataID = dataID
-                else:
-                    tempSimDataID = dataID - 4
-
-                # Preprocessing
-                cc = Image.NoiseReduction(Image.ColorCorrection(image, ccTable[tempSimDataID]))
-                gray = Image.Gray(cc)
-                grayBlur = Image.Blur(gray)
-
-                GUI_IncreaseProgressbar(5)  # Increment progressbar in GUI
+    while terminationMessage is None:
+        # Wait for a new image
+        job = imagesIn.get()
+        if job is None:
+            terminationMessage = "Helper pool stopped"
+            continue
+
+        # Images are passed through shared memory (see Helpers.SendRawImages)
+        [dataID, image, orientation, slot] = job
+        image = ReadImage(image)
+
+        # Raw BayerRG images are converted to upright RGB images here instead of in the main process
+        # (written straight into the tile of the image in the original grid)
+        originalImage = None
+        if orientation is not None:
+            (pattern, operation) = orientation
+            image = Image.Demosaic(image, pattern)
+            tile = OutputTile("Original", dataID, Image.OrientedShape(image.shape, operation), image.dtype)
+            image = Image.Orient(image, operation, dst=tile)
+            originalImage = image
+
+        # Temporary code in order to show demo with 4 virtual cameras
+        if dataID <= 3:
+            tempSimDataID = dataID
+        else:
+            tempSimDataID = dataID - 4
 
-                # Get product data
-                # [acode, sn] = ProductData.GetDataMatrixInfo(grayBlur)
-                # if acode is not False:
-                #     print("Camera ", dataID, " : Acode", acode, "& S/N", sn)
+        # Preprocessing
+        cc = Image.NoiseReduction(Image.ColorCorrection(image, ccTable[tempSimDataID]))
+        gray = Image.Gray(cc)
+        grayBlur = Image.Blur(gray)
 
-                # Perform image analysis
-                analyzedImage = CV.EdgeDetection(grayBlur)
+        GUI_IncreaseProgressbar(5)  # Increment progressbar in GUI
 
-                GUI_IncreaseProgressbar(5)  # Increment progressbar in GUI
+        # Get product data
+        # [acode, sn] = ProductData.GetDataMatrixInfo(grayBlur)
+        # if acode is not False:
+        #     print("Camera ", dataID, " : Acode", acode, "& S/N", sn)
 
-                # Convert result to RGB
-                outputImage = Image.GraytoRGB(analyzedImage)
+        # Perform image analysis
+        analyzedImage = CV.EdgeDetection(grayBlur)
 
-                # Send processed image to parent
-                SendProcessedData(dataID, outputImage)
+        GUI_IncreaseProgressbar(5)  # Increment progressbar in GUI
 
-                GUI_IncreaseProgressbar(5)  # Increment progressbar in GUI
+        # Convert result to RGB (written straight into the tile of the image in the processed grid)
+        tile = OutputTile("Processed", dataID, analyzedImage.shape + (3,), analyzedImage.dtype)
+        outputImage = Image.GraytoRGB(analyzedImage, dst=tile)
 
-                # Reset idle timer
-                IdleTimer.Start()
+        # Send processed image to parent
+        SendProcessedData(dataID, outputImage, originalImage, slot)
 
-                # Increase available helpers by 1
-                SetIdleAnalysisHelpers(1)
+        GUI_IncreaseProgressbar(5)  # Increment progressbar in GUI
 
-        # Run exit code
-        else:
-            # Decrease available helpers by 1
-            SetIdleAnalysisHelpers(-1)
-
-            if terminationMessage is None:
-                terminationMessage = "Main process finished"
-            print("Terminating child...(" + str(terminationMessage + ")"))
+    print("Terminating child...(" + str(terminationMessage + ")"))
 
 
 # Everything outside this if statement will run for every process due to the lack of fork() when creating child processes in Windows
@@ -291,8 +333,10 @@ if __name__ == '__main__':
     # Show GUI window
     GUI.show()
 
-    # Exit code on window exit
-    sys.exit(APP.exec_())
+    # Exit code on window exit (helpers are stopped once the GUI is closed)
+    exitCode = APP.exec_()
+    Helpers.StopAnalysisPool()
+    sys.exit(exitCode)
 
 else:
     print("Subprocess created")
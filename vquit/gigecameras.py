@@ -3,37 +3,65 @@ class ImageAcquirer:
     # Storage for camera modules
     GigE = []
 
+    # Nodes that can only be written while image acquisition is off
+    acquisitionLockedNodes = ["PixelFormat", "Binning", "Width", "Height", "OffsetX", "OffsetY"]
+
     # Maximum fetch tries until reconnect and abort
     fetchTimeout = None
     fetchSoftReboot = None
     fetchAbort = None
+    fetchDeadline = None
+    fetchBackoffMin = None
+    fetchBackoffMax = None
 
     cv2 = None
     np = None
+    json = None
 
     # Function runs when initializing class
-    def __init__(self, SetCameraLighting, Config_module=None, Warnings_module=None):
+    def __init__(self, SetCameraLighting, Config_module=None, Warnings_module=None, ScheduleCameras=None):
 
         # Misc
-        from time import sleep
+        from time import sleep, perf_counter
+        from concurrent.futures import ThreadPoolExecutor
+        import threading
         import sys
 
         self.sleep = sleep
+        self.perf_counter = perf_counter
+        self.threading = threading
         self.warnings = Warnings_module
         self.sys = sys
 
         # Store custom module
         self.FileConfig = Config_module
 
-        # Lights function
+        # Lights function (accepts a camera or a group of cameras, returns a future that is done once the lights have
+        # settled) and the grouping of cameras that can be lit and exposed together (all requested cameras at once
+        # when not given)
         self.SetCameraLighting = SetCameraLighting
+        self.ScheduleCameras = ScheduleCameras
+
+        # Camera backend (Off: GigE cameras | Record: GigE cameras + store raw frames | Replay: recorded frames)
+        simulation = self.FileConfig.Get("Cameras")["Generic"]["Simulation"]
+        self.simulationMode = simulation["Mode"]["Value"]
+        recordingDirectory = simulation["Directory"]["Value"]
 
-        # GenICam helper
-        from harvesters.core import Harvester, TimeoutException
+        if self.simulationMode == "Replay":
+            print("Replaying recorded camera frames from " + str(recordingDirectory))
+            from vquit.simulatedcameras import SimulatedHarvester, SimulatedTimeoutException
+
+            # Init simulated harvester
+            cameraIDs = [camera["ID"] for camera in self.FileConfig.Get("Cameras")["Advanced"]]
+            self.harvester = SimulatedHarvester(recordingDirectory, cameraIDs)
+            self.TimeoutException = SimulatedTimeoutException
+        else:
+            # GenICam helper
+            from harvesters.core import Harvester, TimeoutException
 
-        # Init harvester
-        self.harvester = Harvester()
-        self.TimeoutException = TimeoutException
+            # Init harvester
+            self.harvester = Harvester()
+            self.TimeoutException = TimeoutException
 
         # Temperature
         self.criticalTemp = self.FileConfig.Get("Cameras")["Generic"]["Temperature"]["Critical"]
@@ -42,15 +70,111 @@ class ImageAcquirer:
         # Storage for camera modules
         self.n_camera = self.FileConfig.Get("QuickSettings")["ActiveCameras"]
 
+        # Demosaic and rotation per camera, see ConfigOrientation
+        self.orientations = [("RG", "None")] * self.n_camera
+        from vquit.imageprocessing import Image, BurstAccumulator
+        self.Image = Image()
+
+        # Control channel access per camera is shared by the main loop, startup threads and the thermal monitor
+        self.nodeLocks = [threading.RLock() for _ in range(0, self.n_camera)]
+
+        # Node values last written per camera and acquisition state per camera (used to skip redundant writes)
+        self.nodeShadow = [{} for _ in range(0, self.n_camera)]
+        self.acquiring = [False] * self.n_camera
+        self.appliedCameraConfig = None
+
+        # ROI solver results, sensor limits and applied ROI per camera
+        self.roiCache = {}
+        self.sensorLimits = [None] * self.n_camera
+        self.appliedROI = [None] * self.n_camera
+
+        # Product settings stored on the cameras
+        userSets = self.FileConfig.Get("Cameras")["Generic"]["UserSets"]
+        self.userSetsEnabled = userSets["Enabled"]["Value"]
+        self.userSetSlots = userSets["Slots"]["Value"]
+        self.userSetsFile = userSets["File"]["Value"]
+        self.userSets = {}
+        self.userSetUsage = 0
+        if self.userSetsEnabled:
+            self.ReadUserSets()
+
+        # Return raw BayerRG frames instead of RGB frames (conversion is done by the analysis helpers)
+        self.rawTransport = self.FileConfig.Get("QuickSettings")["RawTransport"]
+
+        # Last exposure time set per camera in microseconds (used for fetch deadlines)
+        self.exposureTimes = [self.FileConfig.Get("Cameras")["Generic"]["AcquisitionControl"]["ExposureTime"][
+                                  "Value"]] * self.n_camera
+
+        # Threads used to wait on the buffers of multiple cameras at once
+        self.fetchExecutor = ThreadPoolExecutor(max_workers=self.n_camera)
+
+        # Buffers reserved by harvester per camera and preallocated output frames per camera
+        buffers = self.FileConfig.Get("Cameras")["Generic"]["Buffers"]
+        self.harvesterBuffers = buffers["HarvesterBuffers"]["Value"]
+        self.framePools = [FramePool(buffers["FramePool"]["Value"]) for _ in range(0, self.n_camera)]
+
+        # Shared grid canvas converted frames are written into during a capture (camNr: index of the tile)
+        self.outputCanvas = None
+        self.outputTiles = {}
+
+        # Frames taken per scan and how they are merged (see Capture)
+        burst = self.FileConfig.Get("Cameras")["Generic"]["Burst"]
+        self.burstFrames = burst["Frames"]["Value"]
+        self.burstMode = burst["Mode"]["Value"]
+        self.burstExposures = burst["Exposures"]["Value"]
+        self.burstActive = False
+        self.burstAccumulators = [BurstAccumulator() for _ in range(0, self.n_camera)]
+        self.burstDtypes = [None] * self.n_camera
+
+        # Binned free-running stream shown while the tool is idle (scan node values are restored on scan start)
+        livePreview = self.FileConfig.Get("Cameras")["Generic"]["LivePreview"]
+        self.previewEnabled = livePreview["Enabled"]["Value"]
+        self.previewBinning = livePreview["Binning"]["Value"]
+        self.previewPeriod = livePreview["AcquisitionPeriod"]["Value"]
+        self.previewTimeout = livePreview["Timeout"]["Value"]
+        self.previewActive = False
+        self.scanNodes = [None] * self.n_camera
+
+        # Duration of the startup steps
+        self.startupTimes = {}
+
+        # Time of the last trigger per camera and time between trigger and buffer of the last frame per camera
+        self.triggerTimes = [None] * self.n_camera
+        self.fetchLatencies = [None] * self.n_camera
+
+        # Host times of the acquisition steps of the last try per camera and device timestamp of the last frame
+        self.frameTimes = [{} for _ in range(0, self.n_camera)]
+        self.deviceTimestamps = [None] * self.n_camera
+
+        # Result of the last RequestFrames call and fetch statistics per camera since startup
+        self.fetchReport = None
+        self.fetchStatistics = [{"Requests": 0, "Attempts": 0, "Failures": 0, "Recoveries": 0, "Latency": 0.0}
+                                for _ in range(0, self.n_camera)]
+
+        # Store raw frames of this session for later replay
+        self.recorder = None
+        if self.simulationMode == "Record":
+            from vquit.simulatedcameras import FrameRecorder
+            self.recorder = FrameRecorder(recordingDirectory, self.n_camera)
+
         self.ImportCTI()  # import cti file
         self.Scan()  # check if producer is available
-        self.Create()  # define image Acquirer objects from discovered devices
-        self.Config()  # configure image acquirer objects
+        self.Startup()  # define and configure image Acquirer objects from discovered devices (in parallel)
+
+        # Sample camera temperatures in the background
+        temperature = self.FileConfig.Get("Cameras")["Generic"]["Temperature"]
+        self.thermalMonitor = ThermalMonitor(self.getTemperature, self.n_camera, self.warningTemp, self.criticalTemp,
+                                             temperature["Interval"], temperature["TrendSamples"], self.warnings)
+        self.thermalMonitor.Start()
 
         self.ImportOpenCV()  # Create opencv module
 
     # Import cti file from GenTL producer
     def ImportCTI(self):
+        # Replayed frames do not need a GenTL producer
+        if self.simulationMode == "Replay":
+            return
+
         # path to GenTL producer
         CTIPath = self.FileConfig.Get("Cameras")["Generic"]["CTIPath"]
 
@@ -76,48 +200,94 @@ class ImageAcquirer:
             self.np = np
         return self.np
 
-    # Scan for available producers
+    def ImportJSON(self):
+        if self.json is None:
+            print("Importing JSON")
+            import json
+            self.json = json
+        return self.json
+
+    # Scan for available producers (returns as soon as every configured camera is visible)
     def Scan(self):
-        tries = 100
-        for i in range(0, tries):
+        cameraIDs = [camera["ID"] for camera in self.FileConfig.Get("Cameras")["Advanced"][0:self.n_camera]]
+
+        # Poll quickly at first and back off to one second between polls
+        timeout = 100
+        interval = 0.05
+        start = self.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
             self.harvester.update()
-            foundDevices = len(self.harvester.device_info_list)
+            visibleIDs = [getattr(deviceInfo, "id_", None) for deviceInfo in self.harvester.device_info_list]
+            foundDevices = len([cameraID for cameraID in cameraIDs if cameraID in visibleIDs])
             print('Scanning for available cameras... ' + str(foundDevices) + " of " + str(
-                self.n_camera) + " (Attempt " + str(i + 1) + " of " + str(tries) + ")", end='\r')
+                self.n_camera) + " (Attempt " + str(attempt) + ")", end='\r')
             if foundDevices >= self.n_camera:
                 break
-            self.sleep(1)
 
-        if len(self.harvester.device_info_list) < self.n_camera:
-            print("Error: Found ", len(self.harvester.device_info_list), " of ", self.n_camera,
-                  "requested producers in network")
-            self.sys.exit(1)
+            if self.perf_counter() - start > timeout:
+                print("Error: Found ", foundDevices, " of ", self.n_camera, "requested producers in network")
+                self.sys.exit(1)
+
+            self.sleep(interval)
+            interval = min(interval * 2, 1)
+
+        self.startupTimes["Scan"] = self.perf_counter() - start
         # print(self.harvester.device_info_list)     # Show details of connected devices
 
-    # Create image acquirer objects
-    def Create(self):
+    # Create and configure all cameras at the same time
+    def Startup(self):
+        self.ConfigSettings()
+
+        # Create camera instances in order written in VQuIT_Config.json>Cameras>Advanced
+        self.GigE = [None] * self.n_camera
+        futures = [self.fetchExecutor.submit(self.StartupCamera, cameraID) for cameraID in range(0, self.n_camera)]
+
         cameraInfo = self.FileConfig.Get("Cameras")["Advanced"]
-        for i in range(0, self.n_camera):
+        cameraTimes = []
+        for cameraID in range(0, self.n_camera):
             try:
-                # Create camera instances in order written in VQuIT_Config.json>Cameras>Advanced
-                newIA = self.harvester.create_image_acquirer(id_=cameraInfo[i]["ID"])
-                self.GigE.append(newIA)
-            except:
-                print("Error: ID '" + str(
-                    cameraInfo[i]["ID"]) + "' not found\nMake sure no other instances are connected to the cameras")
-                exit()
-
-    # Configure image acquirer objects
-    def Config(self):
+                cameraTimes.append(futures[cameraID].result())
+            except Exception as error:
+                print("Error: Camera '" + str(cameraInfo[cameraID]["ID"]) + "' could not be set up (" + str(
+                    error) + ")\nMake sure no other instances are connected to the cameras")
+                self.sys.exit(1)
+
+        # Timing breakdown
+        print("Camera startup times (scan: " + "{0:.3f}".format(self.startupTimes["Scan"]) + " s)")
+        for cameraID in range(0, self.n_camera):
+            print("Camera " + str(cameraInfo[cameraID]["Camera"]) + ": create " + "{0:.3f}".format(
+                cameraTimes[cameraID]["Create"]) + " s | config " + "{0:.3f}".format(
+                cameraTimes[cameraID]["Config"]) + " s")
+        self.startupTimes["Cameras"] = cameraTimes
+
+    # Create and configure a single camera (run in parallel for all cameras)
+    def StartupCamera(self, cameraID):
+        start = self.perf_counter()
+        self.CreateCamera(cameraID)
+        created = self.perf_counter()
+        self.ConfigCamera(cameraID)
+        configured = self.perf_counter()
+
+        return {"Create": created - start, "Config": configured - created}
+
+    # Create image acquirer object
+    def CreateCamera(self, cameraID):
+        cameraInfo = self.FileConfig.Get("Cameras")["Advanced"]
+
+        newIA = self.harvester.create_image_acquirer(id_=cameraInfo[cameraID]["ID"])
+        newIA.num_buffers = self.harvesterBuffers
+        self.GigE[cameraID] = newIA
+
+    # Read camera settings shared by all cameras
+    def ConfigSettings(self):
         # Load configuration file (Use ["Description"] instead of ["Value"] to get a description of said parameter)
         qs = self.FileConfig.Get("QuickSettings")
         c = self.FileConfig.Get("Cameras")
 
-        cameraInfo = c["Advanced"]
         imgFormat = c["Generic"]["ImageFormatControl"]
-        acquisition = c["Generic"]["AcquisitionControl"]
         transport = c["Generic"]["TransportLayerControl"]
-        trigger = c["Generic"]["TimedTriggered_Parameters"]
         fetchError = c["Generic"]["FetchError"]
 
         # Maximum fetch tries per camera
@@ -125,6 +295,11 @@ class ImageAcquirer:
         self.fetchSoftReboot = fetchError["SoftReboot"]
         self.fetchAbort = fetchError["Abort"]
 
+        # Time available for all tries of a scan and wait time between tries (doubles every try)
+        self.fetchDeadline = fetchError["Deadline"]
+        self.fetchBackoffMin = fetchError["BackoffMin"]
+        self.fetchBackoffMax = fetchError["BackoffMax"]
+
         # Jumbo packets
         jumboPackets = qs["JumboPackets"]
         if jumboPackets:
@@ -148,128 +323,231 @@ class ImageAcquirer:
             imgHeight = imgFormat["Resolution"]["Height"]
             binningType = imgFormat["BinningType"]["Value"][0]
 
+        self.cameraSettings = {
+            "Camera": c,
+            "PacketSize": packetSize,
+            "BinningType": binningType,
+            "Width": imgWidth,
+            "Height": imgHeight
+        }
+
+    # Configure image acquirer object
+    def ConfigCamera(self, cameraID):
+        c = self.cameraSettings["Camera"]
+        cameraInfo = c["Advanced"]
+        imgFormat = c["Generic"]["ImageFormatControl"]
+        acquisition = c["Generic"]["AcquisitionControl"]
+        trigger = c["Generic"]["TimedTriggered_Parameters"]
+
         # Set standard camera parameters
-        for cameraID in range(0, len(self.GigE)):
-            print("Setting up camera " + cameraInfo[cameraID]["Camera"] + "...", end="\r")
-            # ImageFormatControl
-            self.GigE[cameraID].remote_device.node_map.PixelFormat.value = imgFormat["PixelFormat"]["Value"][0]
-            self.GigE[cameraID].remote_device.node_map.Binning.value = binningType
-            self.GigE[cameraID].remote_device.node_map.ReverseX.value = False
-            self.GigE[cameraID].remote_device.node_map.ReverseY.value = False
-
-            # AcquisitionControl
-            self.GigE[cameraID].remote_device.node_map.ExposureMode.value = acquisition["ExposureMode"]["Value"][0]
-
-            # TransportLayerControl
-            self.GigE[
-                cameraID].remote_device.node_map.GevSCPSPacketSize.value = packetSize  # Stock: 1060 | recommended 8228
-
-            # TimedTriggered parameters
-            self.GigE[cameraID].remote_device.node_map.FrameAverage.value = trigger["FrameAverage"]["Value"]
-            self.GigE[cameraID].remote_device.node_map.MultiExposureNumber.value = trigger["MultiExposureNumber"][
-                "Value"]
-            self.GigE[cameraID].remote_device.node_map.MultiExposureInactiveRaw.value = \
-                trigger["MultiExposureInactive"][
-                    "Value"]
-
-            # Not in use
-            # AcquisitionPeriod (Integration time - irrelevant when using TimedTriggered)
-            # value: microseconds (min: 102775 µs @4096 x 3008 - BayerRG8 - Binning Disabled (Max frame rate 9.73 Hz) , max: 60s)
+        print("Setting up camera " + cameraInfo[cameraID]["Camera"] + "...", end="\r")
+        # ImageFormatControl
+        self.SetNode(cameraID, "PixelFormat", self.PixelFormat())
+        self.SetNode(cameraID, "Binning", self.cameraSettings["BinningType"])
+
+        # Orientation (mirroring on the sensor leaves a single transpose for the host)
+        self.orientations[cameraID] = self.ConfigOrientation(cameraID,
+                                                             cameraInfo[cameraID]["Orientation"]["Value"],
+                                                             imgFormat["SensorFlip"]["Value"])
+
+        # AcquisitionControl
+        self.SetNode(cameraID, "ExposureMode", acquisition["ExposureMode"]["Value"][0])
+
+        # TransportLayerControl
+        self.SetNode(cameraID, "GevSCPSPacketSize", self.cameraSettings["PacketSize"])  # Stock: 1060 | recommended 8228
+
+        # TimedTriggered parameters
+        self.SetNode(cameraID, "FrameAverage", trigger["FrameAverage"]["Value"])
+        self.SetNode(cameraID, "MultiExposureNumber", trigger["MultiExposureNumber"]["Value"])
+        self.SetNode(cameraID, "MultiExposureInactiveRaw", trigger["MultiExposureInactive"]["Value"])
+
+        # Not in use
+        # AcquisitionPeriod (Integration time - irrelevant when using TimedTriggered)
+        # value: microseconds (min: 102775 µs @4096 x 3008 - BayerRG8 - Binning Disabled (Max frame rate 9.73 Hz) , max: 60s)
 
         # Set resolution
-        self.SetROI(imgHeight, imgWidth)
+        self.SetROI(self.cameraSettings["Height"], self.cameraSettings["Width"], cameraIDs=[cameraID])
+
+    # Pixel format for a bit depth (8: BayerRG8, 12: BayerRG12Packed), default from VQuIT_Config.json
+    def PixelFormat(self, bitDepth=None):
+        imgFormat = self.FileConfig.Get("Cameras")["Generic"]["ImageFormatControl"]
+        if bitDepth is None:
+            bitDepth = imgFormat["BitDepth"]["Value"]
+
+        if bitDepth == 12:
+            return imgFormat["PixelFormat"]["Value"][1]
+        return imgFormat["PixelFormat"]["Value"][0]
+
+    # Set ReverseX/ReverseY of a camera and return the (bayerPattern, hostOperation) that turns its images upright
+    def ConfigOrientation(self, cameraID, rotation, sensorFlip):
+        # Host operations for a rotation in degrees, with and without the camera mirroring the image
+        # (rotate +90 = transpose(flip y), rotate -90 = transpose(flip x), rotate 180 = flip x + flip y)
+        if sensorFlip:
+            reverseX, reverseY, operation = {90: (False, True, "Transpose"),
+                                             -90: (True, False, "Transpose"),
+                                             180: (True, True, "None"),
+                                             0: (False, False, "None")}[rotation]
+        else:
+            reverseX, reverseY = False, False
+            operation = {90: "Rotate90", -90: "Rotate-90", 180: "Rotate180", 0: "None"}[rotation]
 
-    # Start image acquisition
+        self.SetNode(cameraID, "ReverseX", reverseX)
+        self.SetNode(cameraID, "ReverseY", reverseY)
+
+        # Mirroring an image with an even width/height shifts the BayerRG pattern by one pixel
+        pattern = "RG"
+        if reverseX:
+            pattern = pattern[1] + pattern[0]
+        if reverseY:
+            pattern = {"RG": "GB", "GR": "BG"}[pattern]
+
+        # Trust the camera if it reports the shifted pattern itself
+        pixelFormat = str(self.GigE[cameraID].remote_device.node_map.PixelFormat.value)
+        for reportedPattern in ["RG", "GR", "GB", "BG"]:
+            if pixelFormat.startswith("Bayer" + reportedPattern) and reportedPattern != "RG":
+                pattern = reportedPattern
+
+        return pattern, operation
+
+    # Start image acquisition (on all cameras that are not acquiring)
     def Start(self):
         print("\nStart image acquisition\n")
         for i in range(0, len(self.GigE)):
-            self.GigE[i].start_acquisition()
-
-    # Set Region Of Interest resolution and center resulting image (very experimental)
-    def SetROI(self, height, width, disableAcquisition=None):
-        # Check if height and width are valid
-        heightMax = 3000  # Absolute max 3008
-        widthMax = 3072  # Absolute max 4096
-
-        if height <= heightMax and width <= widthMax:
-            # Increment height and width until a valid combination (for which the pixel area is dividable by 4096) is found
-            # (not fool proof but work with most decent aspect ratios that increment with 100)
-            self.warnings.warn("Dynamic ROI is still an experimental feature and can cause errors")
-            rightValue = False
-            heightMaxReached = False
-            while not rightValue:
-                # Try height and width
-                if ((height * width) % 4096) == 0:
-                    rightValue = True
-                else:
-                    # Try height + 1 and width
-                    height += 1
-                    if height > heightMax:
-                        heightMaxReached = True
-                        height = heightMax
-
-                    if ((height * width) % 4096) == 0:
-                        rightValue = True
-                    else:
-                        # Try height and width + 1
-                        if heightMaxReached is False:
-                            height -= 1
-
-                        width += 1
-                        if width > widthMax:
-                            width = widthMax
-
-                        if ((height * width) % 4096) == 0:
-                            rightValue = True
-                        else:
-                            # Set height + 1 and width + 1 and run loop again
-                            height += 1
-                            if height > heightMax:
-                                heightMaxReached = True
-                                height = heightMax
-            print("Dynamic ROI calculator result: " + str(width) + "x" + str(height))
-
-        # Change settings for all available cameras
-        for cameraID in range(0, len(self.GigE)):
+            self.StartCamera(i)
+
+    def StartCamera(self, camNr):
+        if not self.acquiring[camNr]:
+            self.GigE[camNr].start_acquisition()
+            self.acquiring[camNr] = True
+
+    def StopCamera(self, camNr):
+        if self.acquiring[camNr]:
+            self.GigE[camNr].stop_acquisition()
+            self.acquiring[camNr] = False
+
+    # Write a node value only if it differs from the value last written to the camera (returns True when written)
+    def SetNode(self, camNr, name, value):
+        if name in self.nodeShadow[camNr] and self.nodeShadow[camNr][name] == value:
+            return False
+
+        # Image acquisition cannot be on when changing some settings (restarted by Start)
+        if name in self.acquisitionLockedNodes:
+            self.StopCamera(camNr)
+
+        with self.nodeLocks[camNr]:
+            setattr(getattr(self.GigE[camNr].remote_device.node_map, name), "value", value)
+        self.nodeShadow[camNr][name] = value
+        return True
+
+    # Forget the applied node values of a camera (after the camera changed them itself)
+    def ResetNodeShadow(self, camNr, names=None):
+        if names is None:
+            self.nodeShadow[camNr] = {}
+        else:
+            for name in names:
+                self.nodeShadow[camNr].pop(name, None)
+
+    # Set Region Of Interest resolution and center resulting image (all cameras unless cameraIDs is given)
+    def SetROI(self, height, width, disableAcquisition=None, cameraIDs=None):
+        if cameraIDs is None:
+            cameraIDs = range(0, len(self.GigE))
+
+        # Change settings for the requested cameras
+        for cameraID in cameraIDs:
 
             # Check if requested resolution does not exceed the max for each camera
-            widthMax = self.GigE[cameraID].remote_device.node_map.WidthMax.value
-            heightMax = self.GigE[cameraID].remote_device.node_map.HeightMax.value
+            (heightMax, widthMax) = self.SensorLimits(cameraID)
             widthMin = 512
             heightMin = 512
 
             # Check boundaries
             if width in range(widthMin, (widthMax + 1)) and height in range(heightMin, (heightMax + 1)):
+                # Nearest valid resolution (pixel area must be dividable by 4096)
+                (validHeight, validWidth) = self.SolveROI(height, width, heightMax, widthMax)
 
-                # Image acquisition cannot be on when changing this setting
-                if disableAcquisition is True:
-                    self.GigE[cameraID].stop_acquisition()
+                # Center image (even offsets keep the BayerRG pattern intact)
+                offsetX = int((widthMax - validWidth) / 4) * 2
+                offsetY = int((heightMax - validHeight) / 4) * 2
 
-                # Set width and height
-                self.GigE[cameraID].remote_device.node_map.Width.value = width
-                self.GigE[cameraID].remote_device.node_map.Height.value = height
+                # Nothing to do when the ROI is already applied
+                roi = (validHeight, validWidth, offsetX, offsetY)
+                if self.appliedROI[cameraID] == roi:
+                    continue
 
-                # Set offsets
-                offsetX = round((widthMax - width) / 2)
-                offsetY = round((widthMax - width) / 2)
-                self.GigE[cameraID].remote_device.node_map.OffsetX.value = offsetX
-                self.GigE[cameraID].remote_device.node_map.OffsetY.value = offsetY
+                self.WriteROI(cameraID, roi)
+                self.appliedROI[cameraID] = roi
 
                 # Turn image acquisition back on
                 if disableAcquisition is True:
-                    self.GigE[cameraID].start_acquisition()
+                    self.StartCamera(cameraID)
             else:
                 raise ValueError(
                     "Requested ROI (" + str(width) + "x" + str(height) + ") must lie between " + str(
                         widthMin) + "x" + str(heightMin) + " and " + str(widthMax) + "x" + str(
                         heightMax) + " for camera " + str(cameraID))
 
-    def SetCameraConfig(self, productInfo):
+    # Write (height, width, offsetX, offsetY) to a camera
+    def WriteROI(self, cameraID, roi):
+        (height, width, offsetX, offsetY) = roi
+
+        # Set width and height (image acquisition is stopped by SetNode when a value changes)
+        # Offsets are lowered first so the new size always fits the sensor
+        if offsetX < self.nodeShadow[cameraID].get("OffsetX", 0):
+            self.SetNode(cameraID, "OffsetX", offsetX)
+        if offsetY < self.nodeShadow[cameraID].get("OffsetY", 0):
+            self.SetNode(cameraID, "OffsetY", offsetY)
+        self.SetNode(cameraID, "Width", width)
+        self.SetNode(cameraID, "Height", height)
+
+        # Set offsets
+        self.SetNode(cameraID, "OffsetX", offsetX)
+        self.SetNode(cameraID, "OffsetY", offsetY)
+
+    # Maximum resolution of a camera (only read from the camera once)
+    def SensorLimits(self, cameraID):
+        if self.sensorLimits[cameraID] is None:
+            nodeMap = self.GigE[cameraID].remote_device.node_map
+            self.sensorLimits[cameraID] = (nodeMap.HeightMax.value, nodeMap.WidthMax.value)
+        return self.sensorLimits[cameraID]
+
+    # Return the smallest ROI of at least height x width for which the pixel area is dividable by 4096 (2^12)
+    # The area is dividable by 2^12 when the powers of two in height and width add up to 12, so height is rounded
+    # up to a multiple of 2^k and width to a multiple of 2^(12-k) and the smallest valid area is taken
+    def SolveROI(self, height, width, heightMax, widthMax):
+        key = (height, width, heightMax, widthMax)
+        if key in self.roiCache:
+            return self.roiCache[key]
+
+        best = None
+        for k in range(0, 13):
+            heightStep = 2 ** k
+            widthStep = 2 ** (12 - k)
+            newHeight = -(-height // heightStep) * heightStep
+            newWidth = -(-width // widthStep) * widthStep
+
+            if newHeight <= heightMax and newWidth <= widthMax:
+                candidate = (newHeight * newWidth, (newHeight - height) + (newWidth - width), newHeight, newWidth)
+                if best is None or candidate < best:
+                    best = candidate
+
+        if best is None:
+            raise ValueError("No ROI of at least " + str(width) + "x" + str(height) +
+                             " with a pixel area dividable by 4096 fits in " + str(widthMax) + "x" + str(heightMax))
+
+        result = (best[2], best[3])
+        if result != (height, width):
+            print("Dynamic ROI calculator result: " + str(result[1]) + "x" + str(result[0]))
+
+        self.roiCache[key] = result
+        return result
 
-        # Stop image acquisition to make changes
-        self.Stop()
+    def SetCameraConfig(self, productInfo):
+        # Scans run at full resolution
+        if self.previewActive:
+            self.StopPreview()
 
-        # Set configuration for all cameras based on acode of product
+        # Camera settings of the product per camera
+        cameraConfigs = []
         for cameraID in range(0, len(self.GigE)):
             if (cameraID % 2) == 0:
                 # Camera number is even -> bottom camera
@@ -278,15 +556,43 @@ class ImageAcquirer:
                 # Top camera
                 cameraPosition = "TopCameras"
             cameraConfig = productInfo["Configuration"][cameraPosition]
-
-            self.camConfig(cameraID, exposure=cameraConfig["ExposureTime"], gain=cameraConfig["Gain"],
-                           blackLevel=cameraConfig["BlackLevel"])
+            cameraConfigs.append((cameraConfig["ExposureTime"], cameraConfig["Gain"], cameraConfig["BlackLevel"],
+                                  self.PixelFormat(productInfo["Configuration"].get("BitDepth"))))
+
+        # Back-to-back scans of the same settings need no reconfiguration
+        if cameraConfigs == self.appliedCameraConfig:
+            return
+
+        # Switch product with a single UserSetLoad per camera if its settings are stored on the cameras
+        userSet = None
+        if self.userSetsEnabled:
+            signature = self.UserSetSignature(cameraConfigs)
+            userSet = self.FindUserSet(productInfo["Acode"], signature)
+            if userSet is not None and self.LoadUserSet(userSet):
+                for cameraID in range(0, len(self.GigE)):
+                    self.exposureTimes[cameraID] = cameraConfigs[cameraID][0]
+                self.Start()
+                self.appliedCameraConfig = cameraConfigs
+                return
+
+        # Set configuration for all cameras based on acode of product (only changed values are written)
+        for cameraID in range(0, len(self.GigE)):
+            (exposure, gain, blackLevel, pixelFormat) = cameraConfigs[cameraID]
+            self.camConfig(cameraID, exposure=exposure, gain=gain, blackLevel=blackLevel)
+            self.SetNode(cameraID, "PixelFormat", pixelFormat)
 
         # Set ROI
         self.SetROI(2560, 2560)
 
-        # Restart image acquisition after changes are made
-        self.Start()
+        # Store settings in a UserSet slot so the next switch to this product is a single load
+        if self.userSetsEnabled:
+            self.SaveUserSet(productInfo["Acode"], signature)
+
+        # Restart image acquisition if it had to be stopped to make changes
+        if not all(self.acquiring):
+            self.Start()
+
+        self.appliedCameraConfig = cameraConfigs
 
         # self.data_Top_Lighting = []
         # for lights in cameraConfig["Lighting"]["U"]:
@@ -294,97 +600,595 @@ class ImageAcquirer:
         # for lights in cameraConfig["Lighting"]["D"]:
         #     self.data_Top_Lighting.append(lights)
 
+    ############
+    # UserSets #
+    ############
+
+    # Settings stored in a slot are only valid as long as the product and generic camera settings are unchanged
+    # (products changed by ProductData.WriteProductInfo get a new signature and are stored again on next use)
+    def UserSetSignature(self, cameraConfigs):
+        json = self.ImportJSON()
+        from hashlib import md5
+
+        data = [cameraConfigs, self.FileConfig.Get("Cameras")["Generic"], self.FileConfig.Get("QuickSettings")]
+        return md5(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+    # Return slot that holds the settings of a product (or None)
+    def FindUserSet(self, acode, signature):
+        for slot in self.userSetSlots:
+            stored = self.userSets.get(slot)
+            if stored is not None and stored["Acode"] == acode and stored["Signature"] == signature:
+                return slot
+        return None
+
+    # Load settings from a slot on all cameras
+    def LoadUserSet(self, slot):
+        stored = self.userSets[slot]
+        if len(stored["Nodes"]) != len(self.GigE):
+            return False
+
+        print("Loading camera settings from " + str(slot))
+        for cameraID in range(0, len(self.GigE)):
+            # Loading a UserSet is not allowed during image acquisition
+            self.StopCamera(cameraID)
+            self.SetNode(cameraID, "UserSetSelector", slot)
+            self.GigE[cameraID].remote_device.node_map.UserSetLoad.execute()
+
+            # Camera now holds the values that were applied when the slot was saved
+            self.nodeShadow[cameraID] = dict(stored["Nodes"][cameraID])
+            self.nodeShadow[cameraID]["UserSetSelector"] = slot
+
+        self.userSetUsage += 1
+        stored["LastUsed"] = self.userSetUsage
+        self.WriteUserSets()
+        return True
+
+    # Save current settings of all cameras to the least recently used slot
+    def SaveUserSet(self, acode, signature):
+        # Reuse the slot of this product, otherwise take an empty or the least recently used slot
+        slot = None
+        for candidate in self.userSetSlots:
+            stored = self.userSets.get(candidate)
+            if stored is not None and stored["Acode"] == acode:
+                slot = candidate
+        if slot is None:
+            slot = min(self.userSetSlots,
+                       key=lambda candidate: self.userSets[candidate]["LastUsed"] if candidate in self.userSets else -1)
+
+        print("Storing camera settings in " + str(slot))
+        nodes = []
+        for cameraID in range(0, len(self.GigE)):
+            self.StopCamera(cameraID)
+            self.SetNode(cameraID, "UserSetSelector", slot)
+            self.GigE[cameraID].remote_device.node_map.UserSetSave.execute()
+
+            shadow = dict(self.nodeShadow[cameraID])
+            del shadow["UserSetSelector"]
+            nodes.append(shadow)
+
+        self.userSetUsage += 1
+        self.userSets[slot] = {"Acode": acode, "Signature": signature, "LastUsed": self.userSetUsage, "Nodes": nodes}
+        self.WriteUserSets()
+
+    # Read which product is stored in which slot
+    def ReadUserSets(self):
+        json = self.ImportJSON()
+        from os import path
+
+        if path.isfile(self.userSetsFile):
+            with open(self.userSetsFile, 'r') as file:
+                self.userSets = json.load(file)
+        else:
+            self.userSets = {}
+
+        # Continue counting from the most recent slot
+        self.userSetUsage = max([stored["LastUsed"] for stored in self.userSets.values()] + [0])
+
+    # Write which product is stored in which slot
+    def WriteUserSets(self):
+        json = self.ImportJSON()
+
+        with open(self.userSetsFile, 'w') as file:
+            json.dump(self.userSets, file)
+
+    ################
+    # Live preview #
+    ################
+
+    # Switch all cameras to binned free-running acquisition (only the nodes that differ from the scan are written)
+    def StartPreview(self):
+        start = self.perf_counter()
+        factor = int(self.previewBinning.replace("Bayer", "").split("x")[0])
+        exposureModes = self.cameraSettings["Camera"]["Generic"]["AcquisitionControl"]["ExposureMode"]["Value"]
+
+        for camNr in range(0, len(self.GigE)):
+            shadow = self.nodeShadow[camNr]
+            self.scanNodes[camNr] = {"Binning": shadow.get("Binning", self.cameraSettings["BinningType"]),
+                                     "ExposureMode": shadow.get("ExposureMode", exposureModes[0]),
+                                     "AcquisitionPeriod": shadow.get("AcquisitionPeriod")}
+
+            # Same field of view as the scan ROI (size rounded to a multiple of 8, even offsets)
+            (height, width, offsetX, offsetY) = self.appliedROI[camNr]
+            previewROI = (int(height / factor / 8) * 8, int(width / factor / 8) * 8,
+                          int(offsetX / factor / 2) * 2, int(offsetY / factor / 2) * 2)
+
+            self.SetBinning(camNr, self.previewBinning, previewROI)
+            self.SetNode(camNr, "ExposureMode", exposureModes[1])
+            self.SetNode(camNr, "AcquisitionPeriod", self.previewPeriod)
+            self.StartCamera(camNr)
+
+        self.previewActive = True
+        print("Live preview on (" + "{0:.3f}".format(self.perf_counter() - start) + " s)")
+
+    # Switch back to full resolution triggered acquisition
+    def StopPreview(self):
+        start = self.perf_counter()
+
+        for camNr in range(0, len(self.GigE)):
+            scanNodes = self.scanNodes[camNr]
+            self.SetBinning(camNr, scanNodes["Binning"], self.appliedROI[camNr])
+            self.SetNode(camNr, "ExposureMode", scanNodes["ExposureMode"])
+            if scanNodes["AcquisitionPeriod"] is not None:
+                self.SetNode(camNr, "AcquisitionPeriod", scanNodes["AcquisitionPeriod"])
+            self.StartCamera(camNr)
+
+        self.previewActive = False
+        print("Live preview off (" + "{0:.3f}".format(self.perf_counter() - start) + " s)")
+
+    # Change binning and write the ROI that belongs to it
+    def SetBinning(self, camNr, binning, roi):
+        if not self.SetNode(camNr, "Binning", binning):
+            return
+
+        # The camera rescales its ROI when binning changes, start from the origin so any size fits
+        self.ResetNodeShadow(camNr, ["Width", "Height", "OffsetX", "OffsetY"])
+        self.SetNode(camNr, "OffsetX", 0)
+        self.SetNode(camNr, "OffsetY", 0)
+        self.WriteROI(camNr, roi)
+
+    # Return the next buffered frame of every camera as an RGB image (None when a camera did not deliver in time)
+    # Harvester returns the oldest buffer it holds, so a frame can be up to HarvesterBuffers acquisition periods old
+    def RequestPreviewFrames(self):
+        if not self.previewActive:
+            self.StartPreview()
+
+        futures = [self.fetchExecutor.submit(self.FetchPreviewFrame, camNr) for camNr in range(0, len(self.GigE))]
+        frames = [future.result() for future in futures]
+
+        if any(frame is None for frame in frames):
+            return None
+        return frames
+
+    # Fetch a free-running frame (not recorded, converted into new arrays to keep the scan frames intact)
+    def FetchPreviewFrame(self, camNr):
+        try:
+            with self.GigE[camNr].fetch_buffer(timeout=self.previewTimeout) as buffer:
+                component = buffer.payload.components[0]
+                if component is None:
+                    return None
+
+                if self.nodeShadow[camNr].get("PixelFormat") == "BayerRG12Packed":
+                    image = self.UnpackFrame(camNr, component, scratch="Preview")
+                else:
+                    image = component.data.reshape(component.height, component.width)
+
+                pattern, operation = self.orientations[camNr]
+                return self.Image.Orient(self.Image.Demosaic(image, pattern), operation)
+        except self.TimeoutException:
+            return None
+
     # Tweak camera settings on the go
     def camConfig(self, camNr, exposure=None, gain=None, blackLevel=None):
         if exposure:
-            self.GigE[camNr].remote_device.node_map.ExposureTimeRaw.value = exposure
+            self.SetNode(camNr, "ExposureTimeRaw", exposure)
+            self.exposureTimes[camNr] = exposure
         if gain:
-            self.GigE[camNr].remote_device.node_map.GainRaw.value = gain
+            self.SetNode(camNr, "GainRaw", gain)
         if blackLevel:
-            self.GigE[camNr].remote_device.node_map.BlackLevelRaw.value = blackLevel
-
-    # Retrieve camera data
-    def RequestFrame(self, camNr):
-        cv2 = self.ImportOpenCV()
-
-        # Loop process until successful
-        loop = 0
-        fetchImage = True
-        while fetchImage:
-            loop += 1
+            self.SetNode(camNr, "BlackLevelRaw", blackLevel)
+
+    # Retrieve camera data (retries with backoff until the frame is in, the tries run out or the deadline passes)
+    # Returns None when the camera failed, the reason is stored in the fetch report
+    def RequestFrame(self, camNr, deadline=None, report=None):
+        if report is None:
+            report = FetchReport([camNr], self.perf_counter)
+        if deadline is None:
+            deadline = self.perf_counter() + self.fetchDeadline
+
+        backoff = self.fetchBackoffMin
+        while True:
+            loop = report.Attempt(camNr)
+            self.frameTimes[camNr] = {}
             try:
-                if loop > 1 and (loop % 2) is not 0:
-                    # Wait before sending new trigger every odd try that is not the first
-                    self.sleep(0.5)
-
                 # Turn on lights
-                self.SetCameraLighting(camNr, 1)
+                self.CameraLighting([camNr], 1)
 
                 # Trigger camera
-                self.GigE[camNr].remote_device.node_map.TriggerSoftware.execute()
+                self.Trigger(camNr)
 
-                # Wait for buffer until timeout
+                # Wait for buffer until timeout or deadline (turn off lights as soon as the buffer is in)
                 print("Camera " + str(camNr) + ": Fetch buffer (try " + str(loop) + ")...", end='\r')
-                with self.GigE[camNr].fetch_buffer(timeout=self.fetchTimeout) as buffer:
+                timeout = min(self.exposureTimes[camNr] / 1000000 + self.fetchTimeout, deadline - self.perf_counter())
+                image = self.FetchFrame(camNr, max(timeout, 0), onArrival=lambda: self.CameraLighting([camNr], 0))
+                if image is not None:
                     print("Camera " + str(camNr) + ": Fetched (try " + str(loop) + ")", end='\r')
-                    # access the image payload
-                    component = buffer.payload.components[0]
-
-                    if component is not None:
-                        image = component.data.reshape(component.height, component.width)
-
-                        # Turn off lights
-                        self.SetCameraLighting(camNr, 0)
-
-                        # BayerRG -> RGB (Does not work proper when image is already scaled down)
-                        image = cv2.cvtColor(image, cv2.COLOR_BayerRG2RGB)
-
-                        # Transpose + flip to rotate fetched images by +-90 deg
-                        image = cv2.transpose(image)
-                        if camNr % 2 == 0:
-                            # Flip x to rotate bottom cameras -90 deg
-                            flipCode = 0
-                        else:
-                            # Flip y to rotate top cameras +90 deg
-                            flipCode = 1
-                        image = cv2.flip(image, flipCode=flipCode)
-
-                        return image
+                    report.Arrived(camNr, self.fetchLatencies[camNr])
+                    self.RecordTimes(report, camNr)
+                    return image
+                report.Error(camNr, "Empty buffer")
 
             except self.TimeoutException:
                 print("Camera " + str(camNr) + ": Fetch timeout (try " + str(loop) + ")")
+                report.Error(camNr, "Fetch timeout")
             except KeyboardInterrupt:
                 print("Camera " + str(camNr) + ": Fetch interrupted by user (try " + str(loop) + ")")
+                report.Error(camNr, "Interrupted by user")
             # except:
             #     print("Camera " + str(camNr) + ": Unexpected error (try " + str(loop) + ")")
 
-            if loop >= self.fetchSoftReboot:
-                print("Camera" + str(camNr) + ": Failed...trying soft reboot (try " + str(loop) + ")")
-                self.SoftReboot()
+            # Lights stay on when no buffer came in
+            self.CameraLighting([camNr], 0)
 
             if loop >= self.fetchAbort:
                 print("Check camera" + str(camNr) + ": Too manny tries (try " + str(loop) + " of " + str(
                     self.fetchAbort) + ")")
-                fetchImage = False
+                report.Fail(camNr, "Too many tries")
+                self.RecordTimes(report, camNr)
+                return None
+
+            # Wait before sending a new trigger (doubles every try) unless the deadline passes first
+            if self.perf_counter() + backoff >= deadline:
+                print("Check camera" + str(camNr) + ": Scan deadline passed (try " + str(loop) + ")")
+                report.Fail(camNr, "Scan deadline passed")
+                self.RecordTimes(report, camNr)
+                return None
+
+            # Restart acquisition of the failing camera only
+            if loop >= self.fetchSoftReboot:
+                print("Camera" + str(camNr) + ": Failed...trying soft reboot (try " + str(loop) + ")")
+                self.RecoverCamera(camNr)
+                report.Recovered(camNr)
+
+            self.sleep(backoff)
+            backoff = min(backoff * 2, self.fetchBackoffMax)
+
+    # Retrieve camera data from multiple cameras at once (frames are returned in the order of cameraIDs)
+    # Failed cameras return None, see fetchReport for the details of the last request
+    def RequestFrames(self, cameraIDs):
+        cameraIDs = list(cameraIDs)
+
+        # Free-running cameras cannot be triggered
+        if self.previewActive:
+            self.StopPreview()
 
-        # Something went wrong
-        return False
+        # All tries of all cameras have to fit in the scan deadline
+        report = FetchReport(cameraIDs, self.perf_counter)
+        scanDeadline = self.perf_counter() + self.fetchDeadline
+
+        # A light and expose cycle per group of cameras with the same lighting (without a schedule every camera gets
+        # its own cycle so it is only exposed under its own lights)
+        if self.ScheduleCameras is None:
+            schedule = [[camNr] for camNr in cameraIDs]
+        else:
+            schedule = self.ScheduleCameras(cameraIDs)
+
+        fetched = {}
+        for group in schedule:
+            fetched.update(self.FetchGroup(group, report, scanDeadline))
+        frames = [fetched[camNr] for camNr in cameraIDs]
+
+        # Cameras that missed their deadline retry on their own, the healthy cameras are left alone
+        for i in range(0, len(cameraIDs)):
+            camNr = cameraIDs[i]
+            if frames[i] is None:
+                report.Error(camNr, "Fetch timeout")
+                print("Camera " + str(camNr) + ": Missed deadline, retrying on its own")
+                frames[i] = self.RequestFrame(camNr, deadline=scanDeadline, report=report)
+            else:
+                report.Arrived(camNr, self.fetchLatencies[camNr])
+                self.RecordTimes(report, camNr)
+
+        report.Finish()
+        self.fetchReport = report
+        self.UpdateFetchStatistics(report)
+        return frames
+
+    # Light a group of cameras once, trigger them together and wait on their buffers (camNr: frame, None when the
+    # camera missed its deadline)
+    def FetchGroup(self, cameraIDs, report, scanDeadline):
+        # Turn on lights for the whole group
+        for camNr in cameraIDs:
+            self.frameTimes[camNr] = {}
+        self.CameraLighting(cameraIDs, 1)
+
+        # Trigger all cameras before waiting on any of them so the exposures overlap
+        deadlines = {}
+        for camNr in cameraIDs:
+            report.Attempt(camNr)
+            self.Trigger(camNr)
+
+            # Every camera gets its own deadline based on its own exposure time
+            deadlines[camNr] = min(self.perf_counter() + self.exposureTimes[camNr] / 1000000 + self.fetchTimeout,
+                                   scanDeadline)
+
+        # Wait on all buffers at once (one thread per camera)
+        arrived = {camNr: self.threading.Event() for camNr in cameraIDs}
+        futures = {camNr: self.fetchExecutor.submit(self.FetchFrameBefore, camNr, deadlines[camNr],
+                                                    arrived[camNr].set) for camNr in cameraIDs}
+
+        # Turn off lights as soon as every camera has delivered its buffer or missed its deadline
+        for camNr in cameraIDs:
+            arrived[camNr].wait()
+        self.CameraLighting(cameraIDs, 0)
+
+        return {camNr: future.result() for camNr, future in futures.items()}
+
+    # Take a single frame or a burst of frames per camera (VQuIT_Config.json>Cameras>Generic>Burst)
+    # Frames are written straight into the grid canvas (see SetOutputCanvas) when the tile of every camera is given
+    def Capture(self, cameraIDs, tiles=None):
+        cameraIDs = list(cameraIDs)
+        if tiles is not None:
+            self.outputTiles = dict(zip(cameraIDs, tiles))
+        try:
+            if self.burstFrames > 1:
+                return self.RequestBurst(cameraIDs, self.burstFrames, self.burstMode, self.burstExposures)
+            return self.RequestFrames(cameraIDs)
+        finally:
+            self.outputTiles = {}
+
+    # Shared grid canvas Capture writes converted frames into (None to use the frame pools only)
+    def SetOutputCanvas(self, canvas):
+        self.outputCanvas = canvas
+
+    # Take frames back to back and merge them per camera while they come in (frames are returned in the order of
+    # cameraIDs, failed cameras return None, see BurstAccumulator for the modes)
+    # HDR frames cycle through the exposures, given as factors of the exposure time of the product
+    def RequestBurst(self, cameraIDs, frames, mode="Average", exposures=None):
+        cameraIDs = list(cameraIDs)
+        if mode != "HDR" or not exposures:
+            exposures = [1]
+        referenceExposures = {camNr: self.exposureTimes[camNr] for camNr in cameraIDs}
+
+        failed = {}
+        self.burstActive = True
+        try:
+            for frameNr in range(0, frames):
+                # Exposure of this frame (only written when it changes)
+                factor = exposures[frameNr % len(exposures)]
+                for camNr in cameraIDs:
+                    self.camConfig(camNr, exposure=int(referenceExposures[camNr] * factor))
+
+                images = self.RequestFrames(cameraIDs)
+                for camNr in self.fetchReport.Failed():
+                    failed.setdefault(camNr, "Frame " + str(frameNr + 1) + " of burst: " + str(
+                        self.fetchReport.cameras[camNr]["Error"]))
+
+                # Merge frames of all cameras at the same time
+                futures = [self.fetchExecutor.submit(self.AccumulateFrame, cameraIDs[i], images[i], frameNr, mode)
+                           for i in range(0, len(cameraIDs)) if cameraIDs[i] not in failed]
+                for future in futures:
+                    future.result()
+        finally:
+            self.burstActive = False
+
+            # Back to the exposure of the product
+            for camNr in cameraIDs:
+                self.camConfig(camNr, exposure=referenceExposures[camNr])
+
+        # Failed cameras of any frame show up in the report of the last frame
+        for camNr, message in failed.items():
+            self.fetchReport.Fail(camNr, message)
+
+        results = []
+        for camNr in cameraIDs:
+            if camNr in failed:
+                results.append(None)
+            else:
+                accumulator = self.burstAccumulators[camNr]
+                frame = self.OutputFrame(camNr, accumulator.accumulator.shape, self.burstDtypes[camNr])
+                results.append(accumulator.Result(frame, referenceExposures[camNr]))
+        return results
+
+    # Add a burst frame of a camera to its accumulator
+    def AccumulateFrame(self, camNr, image, frameNr, mode):
+        np = self.ImportNumpy()
+        accumulator = self.burstAccumulators[camNr]
+
+        if frameNr == 0:
+            accumulator.Reset(image.shape, mode)
+            self.burstDtypes[camNr] = image.dtype
+        scratch = self.framePools[camNr].Scratch("BurstWeights", image.shape, np.float32) if mode == "HDR" else None
+        accumulator.Add(image, self.exposureTimes[camNr], scratch)
+
+    # Output frame of a camera (burst frames go to a scratch buffer so they do not use up the frame pool)
+    # Converted frames go to the tile of the camera in the output canvas when it has one (raw frames never do)
+    def OutputFrame(self, camNr, shape, dtype):
+        if self.burstActive:
+            return self.framePools[camNr].Scratch("Burst", shape, dtype)
+
+        tile = self.outputTiles.get(camNr)
+        if tile is not None and self.outputCanvas is not None and not self.rawTransport:
+            frame = self.outputCanvas.Tile(tile, shape, dtype)
+            if frame is not None:
+                return frame
+        return self.framePools[camNr].Next(shape, dtype)
+
+    # Wait for a triggered frame until the deadline passes (run by the fetch threads of RequestFrames)
+    def FetchFrameBefore(self, camNr, deadline, onArrival):
+        try:
+            return self.FetchFrame(camNr, max(deadline - self.perf_counter(), 0), onArrival=onArrival)
+        except self.TimeoutException:
+            print("Camera " + str(camNr) + ": Fetch timeout (deadline passed)")
+            return None
+        finally:
+            # Never leave RequestFrames waiting on a camera
+            onArrival()
+
+    # Switch the lights of a camera or a group of cameras and record when the switch was requested and done
+    # Only turning lights on waits until they have settled, turning them off is queued (the next scene waits for it)
+    def CameraLighting(self, cameraIDs, state):
+        if state:
+            for camNr in cameraIDs:
+                self.Stamp(camNr, "LightRequest")
+            self.SetCameraLighting(cameraIDs, state).result()
+            for camNr in cameraIDs:
+                self.Stamp(camNr, "LightOn")
+        else:
+            times = [self.frameTimes[camNr] for camNr in cameraIDs]
+            future = self.SetCameraLighting(cameraIDs, state)
+            future.add_done_callback(lambda future: self.StampAll(times, "LightOff"))
+
+    # Record the time of an acquisition step in the timestamps of multiple tries
+    def StampAll(self, times, event):
+        now = self.perf_counter()
+        for frameTimes in times:
+            frameTimes[event] = now
+
+    # Record the time of an acquisition step of the current try of a camera
+    def Stamp(self, camNr, event):
+        self.frameTimes[camNr][event] = self.perf_counter()
+
+    # Copy the timestamps of the last try of a camera into the fetch report
+    def RecordTimes(self, report, camNr):
+        report.Timestamps(camNr, self.frameTimes[camNr], self.deviceTimestamps[camNr])
+
+    # Restart image acquisition of a single camera (clears its pending buffers and triggers)
+    def RecoverCamera(self, camNr):
+        with self.nodeLocks[camNr]:
+            self.StopCamera(camNr)
+            self.StartCamera(camNr)
+
+    # Add the results of a request to the statistics per camera
+    def UpdateFetchStatistics(self, report):
+        for camNr, result in report.cameras.items():
+            statistics = self.fetchStatistics[camNr]
+            statistics["Requests"] += 1
+            statistics["Attempts"] += result["Attempts"]
+            statistics["Recoveries"] += result["Recoveries"]
+            if result["Failed"]:
+                statistics["Failures"] += 1
+            else:
+                statistics["Latency"] += result["Latency"]
+
+    # Average tries and latency of a camera since startup
+    def FetchStatistics(self, camNr):
+        statistics = self.fetchStatistics[camNr]
+        frames = statistics["Requests"] - statistics["Failures"]
+        return {"Requests": statistics["Requests"],
+                "Failures": statistics["Failures"],
+                "Recoveries": statistics["Recoveries"],
+                "AttemptsPerRequest": statistics["Attempts"] / max(statistics["Requests"], 1),
+                "Latency": statistics["Latency"] / frames if frames > 0 else None}
+
+    # Send software trigger to camera
+    def Trigger(self, camNr):
+        with self.nodeLocks[camNr]:
+            self.triggerTimes[camNr] = self.perf_counter()
+            self.GigE[camNr].remote_device.node_map.TriggerSoftware.execute()
+        self.frameTimes[camNr]["Trigger"] = self.triggerTimes[camNr]
+
+    # Wait for the buffer of a triggered camera and convert it to an RGB image
+    def FetchFrame(self, camNr, timeout, onArrival=None):
+        self.Stamp(camNr, "FetchStart")
+        self.deviceTimestamps[camNr] = None
+        with self.GigE[camNr].fetch_buffer(timeout=timeout) as buffer:
+            self.Stamp(camNr, "Buffer")
+
+            # access the image payload
+            component = buffer.payload.components[0]
+
+            if component is None:
+                return None
+
+            # Start of the exposure on the camera clock (in ns, not comparable with host times)
+            self.deviceTimestamps[camNr] = getattr(buffer, "timestamp_ns", None)
+
+            # Buffer is in, lights are no longer needed
+            self.fetchLatencies[camNr] = self.frameTimes[camNr]["Buffer"] - self.triggerTimes[camNr]
+            if onArrival is not None:
+                onArrival()
+
+            packed = self.nodeShadow[camNr].get("PixelFormat") == "BayerRG12Packed"
+            if not packed:
+                image = component.data.reshape(component.height, component.width)
+
+            # Store raw frame for replay (packed payloads are stored as received)
+            if self.recorder is not None:
+                self.recorder.Save(camNr, component.data if packed else image, self.fetchLatencies[camNr])
+
+            if packed:
+                # Unpack 12 bit data into a 16 bit frame
+                image = self.UnpackFrame(camNr, component)
+                self.Stamp(camNr, "Unpack")
+
+            # Raw transport leaves demosaicing and rotating to the analysis helpers
+            if self.rawTransport:
+                return self.CopyFrame(camNr, image)
+
+            return self.ConvertFrame(camNr, image)
+
+    # Unpack BayerRG12Packed payload into a preallocated 16 bit frame (values are scaled to the full 16 bit range)
+    def UnpackFrame(self, camNr, component, scratch="Unpacked"):
+        np = self.ImportNumpy()
+        pool = self.framePools[camNr]
+        height, width = component.height, component.width
+
+        unpacked = pool.Scratch(scratch, (height, width), np.uint16)
+        data = component.data
+        if data.dtype == np.uint16:
+            # Producer already unpacked the data (12 bit values in 16 bit containers)
+            np.left_shift(data.reshape(height, width), 4, out=unpacked)
+        else:
+            self.Image.Unpack12Packed(data, unpacked, pool.Scratch(scratch + "Nibbles", (int(height * width / 2),),
+                                                                   np.uint8))
+        return unpacked
+
+    # Copy raw BayerRG data out of the harvester buffer into a preallocated frame of the camera
+    def CopyFrame(self, camNr, image):
+        np = self.ImportNumpy()
+
+        frame = self.OutputFrame(camNr, image.shape, image.dtype)
+        np.copyto(frame, image)
+        self.Stamp(camNr, "Copy")
+        return frame
+
+    # Convert raw BayerRG data into a rotated RGB image
+    # (written into the preallocated frames of the camera, the payload itself is never copied)
+    def ConvertFrame(self, camNr, image):
+        pool = self.framePools[camNr]
+        pattern, operation = self.orientations[camNr]
+        height, width = image.shape[:2]
+
+        # Upright images need no host rotation, demosaic straight into the output frame
+        if operation == "None":
+            frame = self.OutputFrame(camNr, (height, width, 3), image.dtype)
+            self.Image.Demosaic(image, pattern, dst=frame)
+            self.Stamp(camNr, "Demosaic")
+            return frame
+
+        # BayerRG -> RGB (Does not work proper when image is already scaled down)
+        demosaiced = pool.Scratch("Demosaic", (height, width, 3), image.dtype)
+        self.Image.Demosaic(image, pattern, dst=demosaiced)
+        self.Stamp(camNr, "Demosaic")
+
+        # Rotate (or only transpose when the camera already mirrored the image) in a single pass
+        frame = self.OutputFrame(camNr, self.Image.OrientedShape(demosaiced.shape, operation), image.dtype)
+        self.Image.Orient(demosaiced, operation, dst=frame)
+        self.Stamp(camNr, "Rotate")
+        return frame
+
+    # (bayerPattern, hostOperation) that turns the images of a camera upright (set by Config)
+    def Orientation(self, camNr):
+        return self.orientations[camNr]
 
     # Get camera temperature
     def getTemperature(self, camNr):
-        return float(self.GigE[camNr].remote_device.node_map.DeviceTemperatureRaw.value / 100)
+        with self.nodeLocks[camNr]:
+            return float(self.GigE[camNr].remote_device.node_map.DeviceTemperatureRaw.value / 100)
 
-    # Return thermal performance of the camera
+    # Return thermal performance of the cameras (sampled in the background by the thermal monitor)
     def thermalCondition(self):
-        for i in range(0, self.n_camera):
-            temp = self.getTemperature(i)
-            if temp > self.criticalTemp:
-                self.warnings.warn("Camera temperature critical")
-                return "Critical"
-            elif temp > self.warningTemp:
-                self.warnings.warn("Camera temperature above " + str(self.warningTemp))
-                return "Warning"
-        return "Normal"
+        return self.thermalMonitor.Condition()
 
     # Get camera features
     def getCameraAttributes(self):
@@ -394,19 +1198,248 @@ class ImageAcquirer:
     def Stop(self):
         print("Stop image acquisition")
         for i in range(0, len(self.GigE)):
-            self.GigE[i].stop_acquisition()
+            self.StopCamera(i)
 
     # Stop image acquisition
     def Destroy(self):
         print("Destroy image acquire objects")
+
+        # Stop sampling temperatures before the cameras disappear
+        self.thermalMonitor.Stop()
+
+        # Finish writing the recording of this session
+        if self.recorder is not None:
+            self.recorder.Stop()
+            self.recorder = None
+
         for i in range(0, len(self.GigE)):
             self.GigE[i].destroy()
 
+        # Release fetch threads
+        self.fetchExecutor.shutdown(wait=False)
+
     # Reset harvester
     def Reset(self):
         self.harvester.reset()
 
-    # Soft reboot
+    # Soft reboot (all cameras, see RecoverCamera for a single camera)
     def SoftReboot(self):
         self.Stop()
         self.Start()
+
+
+# Outcome of a frame request per camera (tries, recoveries, latency and the reason a camera failed)
+class FetchReport:
+
+    # Function runs when initializing class
+    def __init__(self, cameraIDs, perf_counter):
+        self.perf_counter = perf_counter
+        self.start = perf_counter()
+        self.duration = None
+        self.cameras = {camNr: {"Attempts": 0, "Recoveries": 0, "Latency": None, "Error": None, "Failed": False,
+                                "Timestamps": {}, "DeviceTimestamp": None}
+                        for camNr in cameraIDs}
+
+    # Count a new try and return the try number
+    def Attempt(self, camNr):
+        self.cameras[camNr]["Attempts"] += 1
+        return self.cameras[camNr]["Attempts"]
+
+    def Arrived(self, camNr, latency):
+        self.cameras[camNr]["Latency"] = latency
+
+    def Error(self, camNr, message):
+        self.cameras[camNr]["Error"] = message
+
+    def Recovered(self, camNr):
+        self.cameras[camNr]["Recoveries"] += 1
+
+    def Fail(self, camNr, message):
+        self.cameras[camNr]["Error"] = message
+        self.cameras[camNr]["Failed"] = True
+
+    # Host times of the acquisition steps of the last try (in seconds since the start of the request)
+    def Timestamps(self, camNr, times, deviceTimestamp):
+        self.cameras[camNr]["Timestamps"] = {event: time - self.start for event, time in times.items()}
+        self.cameras[camNr]["DeviceTimestamp"] = deviceTimestamp
+
+    # Duration of the acquisition steps of the last try of a camera (steps that did not happen are left out)
+    def Breakdown(self, camNr):
+        times = self.cameras[camNr]["Timestamps"]
+        steps = [("Lighting", "LightRequest", "LightOn"),
+                 ("Exposure + transfer", "Trigger", "Buffer"),
+                 ("Unpack", "Buffer", "Unpack"),
+                 ("Demosaic", "Unpack" if "Unpack" in times else "Buffer", "Demosaic"),
+                 ("Rotate", "Demosaic", "Rotate"),
+                 ("Copy", "Unpack" if "Unpack" in times else "Buffer", "Copy"),
+                 ("Lights on after buffer", "Buffer", "LightOff")]
+
+        breakdown = {}
+        for (name, first, last) in steps:
+            if first in times and last in times:
+                breakdown[name] = times[last] - times[first]
+        return breakdown
+
+    def Finish(self):
+        self.duration = self.perf_counter() - self.start
+
+    # Cameras that did not deliver a frame
+    def Failed(self):
+        return [camNr for camNr, result in self.cameras.items() if result["Failed"]]
+
+    def Summary(self):
+        lines = ["Fetch report (" + "{0:.3f}".format(self.duration) + " s)"]
+        for camNr, result in self.cameras.items():
+            if result["Failed"]:
+                state = "Failed: " + str(result["Error"])
+            else:
+                state = "Latency " + "{0:.3f}".format(result["Latency"]) + " s"
+            lines.append("Camera " + str(camNr) + ": " + state + " | tries " + str(
+                result["Attempts"]) + " | recoveries " + str(result["Recoveries"]))
+            lines.append("    " + " | ".join([name + " " + "{0:.3f}".format(duration) + " s" for name, duration in
+                                              self.Breakdown(camNr).items()]))
+        return "\n".join(lines)
+
+
+# Preallocated frames of a single camera
+# Output frames are handed out round robin and are overwritten after `size` captures,
+# so size must cover the number of frames per camera that are in use at the same time
+class FramePool:
+    np = None
+
+    # Function runs when initializing class
+    def __init__(self, size):
+        self.size = size
+        self.frames = []
+        self.index = 0
+        self.scratch = {}
+
+    def ImportNumpy(self):
+        if self.np is None:
+            import numpy
+            self.np = numpy
+        return self.np
+
+    # Return next output frame (all frames are reallocated when the requested format changes)
+    def Next(self, shape, dtype):
+        np = self.ImportNumpy()
+
+        if len(self.frames) == 0 or self.frames[0].shape != shape or self.frames[0].dtype != dtype:
+            self.frames = [np.empty(shape, dtype=dtype) for _ in range(0, self.size)]
+            self.index = 0
+
+        frame = self.frames[self.index]
+        self.index = (self.index + 1) % self.size
+        return frame
+
+    # Return intermediate buffer that is reused on every capture
+    def Scratch(self, name, shape, dtype):
+        np = self.ImportNumpy()
+
+        buffer = self.scratch.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self.scratch[name] = buffer
+        return buffer
+
+
+# Samples camera temperatures in a background thread so the main loop only reads cached values
+class ThermalMonitor:
+
+    # Function runs when initializing class
+    def __init__(self, getTemperature, n_camera, warningTemp, criticalTemp, interval, trendSamples,
+                 Warnings_module=None):
+        import threading
+        from collections import deque
+        from time import perf_counter
+
+        self.threading = threading
+        self.perf_counter = perf_counter
+        self.warnings = Warnings_module
+
+        self.getTemperature = getTemperature
+        self.n_camera = n_camera
+        self.warningTemp = warningTemp
+        self.criticalTemp = criticalTemp
+        self.interval = interval
+
+        # Latest temperature and recent (time, temperature) samples per camera
+        self.lock = threading.Lock()
+        self.temperatures = [None] * n_camera
+        self.history = [deque(maxlen=trendSamples) for _ in range(0, n_camera)]
+        self.condition = "Normal"
+
+        # Set when the cameras reach the warning or critical temperature
+        self.warningEvent = threading.Event()
+        self.criticalEvent = threading.Event()
+
+        self.stopEvent = threading.Event()
+        self.thread = None
+
+    def Start(self):
+        # First sample before returning so the condition is known from the start
+        self.Sample()
+
+        self.stopEvent.clear()
+        self.thread = self.threading.Thread(target=self.Run, name="ThermalMonitor", daemon=True)
+        self.thread.start()
+
+    def Stop(self):
+        self.stopEvent.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def Run(self):
+        while not self.stopEvent.wait(self.interval):
+            try:
+                self.Sample()
+            except Exception as error:
+                print("Thermal monitor: Could not read camera temperatures (" + str(error) + ")")
+
+    # Read temperature of every camera and update the condition
+    def Sample(self):
+        condition = "Normal"
+        for camNr in range(0, self.n_camera):
+            temp = self.getTemperature(camNr)
+            with self.lock:
+                self.temperatures[camNr] = temp
+                self.history[camNr].append((self.perf_counter(), temp))
+
+            if temp > self.criticalTemp:
+                condition = "Critical"
+            elif temp > self.warningTemp and condition == "Normal":
+                condition = "Warning"
+
+        # Raise events when the condition changes
+        if condition != self.condition:
+            if condition == "Critical":
+                self.warnings.warn("Camera temperature critical")
+                self.criticalEvent.set()
+            elif condition == "Warning":
+                self.warnings.warn("Camera temperature above " + str(self.warningTemp))
+                self.warningEvent.set()
+
+            if condition != "Critical":
+                self.criticalEvent.clear()
+            if condition == "Normal":
+                self.warningEvent.clear()
+
+        self.condition = condition
+
+    # Return cached thermal performance of the cameras
+    def Condition(self):
+        return self.condition
+
+    # Return latest temperature of a camera
+    def Temperature(self, camNr):
+        with self.lock:
+            return self.temperatures[camNr]
+
+    # Return temperature trend of a camera in degrees per minute
+    def Trend(self, camNr):
+        with self.lock:
+            samples = list(self.history[camNr])
+        if len(samples) < 2 or samples[-1][0] == samples[0][0]:
+            return 0.0
+        return (samples[-1][1] - samples[0][1]) / (samples[-1][0] - samples[0][0]) * 60
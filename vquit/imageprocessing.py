@@ -3,6 +3,9 @@ class Image:
     # Filter parameters
     NR_Blur = 25
 
+    # Position of every image in the grid (rows of image indices)
+    GridLayout = [[7, 5, 3, 1], [6, 4, 2, 0]]
+
     # Packages
     cv2 = None
     np = None
@@ -42,9 +45,77 @@ class Image:
         image = cv2.cvtColor(image, cv2.COLOR_BayerRG2RGB)
         return image
 
-    def GraytoRGB(self, image):
+    # Unpack GigE Vision 12 bit packed data (2 pixels in 3 bytes) into a preallocated uint16 array
+    # Values are shifted to the most significant bits so they use the full 16 bit range
+    #   byte 0: pixel 0 bits 11..4 | byte 1: pixel 1 bits 3..0, pixel 0 bits 3..0 | byte 2: pixel 1 bits 11..4
+    def Unpack12Packed(self, data, out, nibbles=None):
+        np = self.ImportNumpy()
+
+        packed = data.reshape(-1, 3)
+        pixels = out.reshape(-1, 2)
+        even = pixels[:, 0]
+        odd = pixels[:, 1]
+        if nibbles is None:
+            nibbles = np.empty(packed.shape[0], dtype=np.uint8)
+
+        # Pixel 0: byte 0 << 8 | low nibble of byte 1 << 4
+        np.left_shift(packed[:, 0], 8, out=even, dtype=np.uint16)
+        np.bitwise_and(packed[:, 1], 0x0F, out=nibbles)
+        np.left_shift(nibbles, 4, out=nibbles)
+        np.bitwise_or(even, nibbles, out=even)
+
+        # Pixel 1: byte 2 << 8 | high nibble of byte 1
+        np.left_shift(packed[:, 2], 8, out=odd, dtype=np.uint16)
+        np.bitwise_and(packed[:, 1], 0xF0, out=nibbles)
+        np.bitwise_or(odd, nibbles, out=odd)
+        return out
+
+    # Convert 16 bit images to 8 bit (8 bit images are returned as is)
+    def To8Bit(self, image):
+        cv2 = self.ImportOpenCV()
+        np = self.ImportNumpy()
+
+        if image.dtype == np.uint8:
+            return image
+        return cv2.convertScaleAbs(image, alpha=1 / 256)
+
+    # Demosaic raw Bayer data with the given pattern ("RG", "GR", "GB" or "BG") into dst if given
+    def Demosaic(self, image, pattern="RG", dst=None):
         cv2 = self.ImportOpenCV()
-        image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+
+        code = {"RG": cv2.COLOR_BayerRG2RGB,
+                "GR": cv2.COLOR_BayerGR2RGB,
+                "GB": cv2.COLOR_BayerGB2RGB,
+                "BG": cv2.COLOR_BayerBG2RGB}[pattern]
+        return cv2.cvtColor(image, code, dst=dst)
+
+    # Turn image upright in a single pass ("Rotate90", "Rotate-90", "Rotate180", "Transpose" or "None")
+    def Orient(self, image, operation, dst=None):
+        cv2 = self.ImportOpenCV()
+
+        if operation == "None":
+            if dst is None:
+                return image
+            dst[...] = image
+            return dst
+        elif operation == "Transpose":
+            return cv2.transpose(image, dst=dst)
+        else:
+            rotateCode = {"Rotate90": cv2.ROTATE_90_CLOCKWISE,
+                          "Rotate-90": cv2.ROTATE_90_COUNTERCLOCKWISE,
+                          "Rotate180": cv2.ROTATE_180}[operation]
+            return cv2.rotate(image, rotateCode, dst=dst)
+
+    # Shape of an image after Orient
+    @staticmethod
+    def OrientedShape(shape, operation):
+        if operation in ["Rotate90", "Rotate-90", "Transpose"]:
+            return (shape[1], shape[0]) + tuple(shape[2:])
+        return tuple(shape)
+
+    def GraytoRGB(self, image, dst=None):
+        cv2 = self.ImportOpenCV()
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB, dst=dst)
         return image
 
     # Color correction
@@ -54,10 +125,11 @@ class Image:
 
         b, g, r = cv2.split(image)
 
-        # Multiply color array by ID specific gain and clip at 255
-        b = np.array(np.clip(b * ccTable[2], 0, 255), dtype=np.uint8)
-        g = np.array(np.clip(g * ccTable[1], 0, 255), dtype=np.uint8)
-        r = np.array(np.clip(r * ccTable[0], 0, 255), dtype=np.uint8)
+        # Multiply color array by ID specific gain and clip at the maximum value (255 for 8 bit images)
+        maxValue = np.iinfo(image.dtype).max
+        b = np.array(np.clip(b * ccTable[2], 0, maxValue), dtype=image.dtype)
+        g = np.array(np.clip(g * ccTable[1], 0, maxValue), dtype=image.dtype)
+        r = np.array(np.clip(r * ccTable[0], 0, maxValue), dtype=image.dtype)
         image = cv2.merge([b, g, r])
 
         return image
@@ -71,7 +143,7 @@ class Image:
         ndimage = self.ImportScipy(ndimageOnly=True)
         np = self.ImportNumpy()
 
-        return ndimage.binary_opening(binaryImage, structure=np.ones((2, 2))).astype(self.np.bool)
+        return ndimage.binary_opening(binaryImage, structure=np.ones((2, 2))).astype(bool)
 
     # Crop image to perform actions on specific parts
     @staticmethod
@@ -110,14 +182,19 @@ class Image:
 
     def NoiseReduction(self, image):
         cv2 = self.ImportOpenCV()
-        return cv2.bilateralFilter(image, 7, 50, 50)
 
-    # combine images into a grid
-    def Grid(self, imageArray):
+        # Bilateral filter only works on 8 bit images
+        return cv2.bilateralFilter(self.To8Bit(image), 7, 50, 50)
+
+    # combine images into a grid (images already written into their tile of a canvas are not copied again)
+    def Grid(self, imageArray, canvas=None):
+        if canvas is not None:
+            grid = canvas.Grid(imageArray)
+            if grid is not None:
+                return grid
+
         np = self.ImportNumpy()
-        r1 = np.hstack((imageArray[7], imageArray[5], imageArray[3], imageArray[1]))
-        r2 = np.hstack((imageArray[6], imageArray[4], imageArray[2], imageArray[0]))
-        return np.vstack((r1, r2))
+        return np.vstack([np.hstack([imageArray[index] for index in row]) for row in self.GridLayout])
 
 
 ImageModule = Image()
@@ -162,6 +239,7 @@ class OpenCV:
         cv2 = self.ImportOpenCV()
         np = self.ImportNumpy()
 
+        im = ImageModule.To8Bit(im)  # 8 bit output requires 8 bit input
         laplacian = cv2.Laplacian(im, cv2.CV_8U, self.ksize, filterScale)  # Apply filter
         laplacianThresh = laplacian > threshold * np.max(laplacian)  # Convert to binary
         laplacianThresh = ImageModule.BinaryNoiseReduction(laplacianThresh)
@@ -185,3 +263,116 @@ class OpenCV:
 
     # Variables
     imgW_px = 0
+
+
+# Merges a burst of frames of a single camera into one frame while the frames come in
+# (memory stays at one float32 accumulator, plus one weight sum for HDR, no matter how many frames are taken)
+#   Average: mean of all frames (reduces noise)
+#   HDR:     radiance estimate sum(w(z) * z / t) / sum(w(z)) with hat weights w(z) that ignore dark and saturated
+#            pixels, scaled back to the reference exposure and compressed with a global Reinhard curve
+class BurstAccumulator:
+    # Packages
+    cv2 = None
+    np = None
+
+    # Function runs when initializing class
+    def __init__(self):
+        self.accumulator = None
+        self.weightSum = None
+        self.weightTables = {}
+        self.mode = None
+        self.frames = 0
+
+    def ImportOpenCV(self):
+        if self.cv2 is None:
+            import cv2
+            self.cv2 = cv2
+        return self.cv2
+
+    def ImportNumpy(self):
+        if self.np is None:
+            import numpy
+            self.np = numpy
+        return self.np
+
+    # Start a new burst (buffers are only reallocated when the frame size changes)
+    def Reset(self, shape, mode):
+        np = self.ImportNumpy()
+
+        if self.accumulator is None or self.accumulator.shape != shape:
+            self.accumulator = np.empty(shape, dtype=np.float32)
+            self.weightSum = None
+        if mode == "HDR" and self.weightSum is None:
+            self.weightSum = np.empty(shape, dtype=np.float32)
+
+        self.accumulator.fill(0)
+        if mode == "HDR":
+            self.weightSum.fill(0)
+        self.mode = mode
+        self.frames = 0
+
+    # Hat weight per pixel value and the radiance contribution w(z) * z / t per pixel value (lookup tables)
+    def WeightTable(self, dtype, exposure):
+        np = self.ImportNumpy()
+
+        key = (np.dtype(dtype).str, exposure)
+        if key not in self.weightTables:
+            maxValue = np.iinfo(dtype).max
+            values = np.arange(0, maxValue + 1, dtype=np.float32)
+            weights = np.maximum(np.minimum(values, maxValue - values), 1)
+            self.weightTables[key] = (weights, weights * values / exposure)
+        return self.weightTables[key]
+
+    # Replace every pixel value by its table entry (OpenCV only has lookup tables for 8 bit images)
+    def Lookup(self, frame, table, out):
+        cv2 = self.ImportOpenCV()
+        np = self.ImportNumpy()
+
+        if frame.dtype == np.uint8:
+            cv2.LUT(frame, table, dst=out)
+        else:
+            np.take(table, frame, out=out)
+
+    # Add a frame taken with the given exposure time (scratch is a float32 buffer of the frame size)
+    def Add(self, frame, exposure, scratch):
+        cv2 = self.ImportOpenCV()
+        np = self.ImportNumpy()
+
+        if self.mode == "HDR":
+            weights, radiance = self.WeightTable(frame.dtype, exposure)
+            self.Lookup(frame, radiance, scratch)
+            cv2.add(self.accumulator, scratch, dst=self.accumulator)
+            self.Lookup(frame, weights, scratch)
+            cv2.add(self.weightSum, scratch, dst=self.weightSum)
+        else:
+            cv2.accumulate(frame, self.accumulator)
+        self.frames += 1
+
+    # Write the merged frame into out (same shape and dtype as the frames, the accumulator is used as scratch)
+    def Result(self, out, referenceExposure=None):
+        np = self.ImportNumpy()
+
+        maxValue = np.iinfo(out.dtype).max
+        merged = self.accumulator
+
+        if self.mode == "HDR":
+            # Radiance at the reference exposure relative to the maximum pixel value
+            np.divide(merged, self.weightSum, out=merged)
+            np.multiply(merged, referenceExposure / maxValue, out=merged)
+
+            # Extended Reinhard L * (1 + L / Lw^2) / (1 + L) with the brightest pixel as white point Lw
+            # (identical to the input when nothing exceeds the maximum pixel value)
+            white = max(float(merged.max()), 1)
+            np.add(merged, 1, out=self.weightSum)
+            np.divide(merged, self.weightSum, out=self.weightSum)
+            np.multiply(merged, 1 / (white * white), out=merged)
+            np.add(merged, 1, out=merged)
+            np.multiply(merged, self.weightSum, out=merged)
+            np.multiply(merged, maxValue, out=merged)
+        else:
+            np.multiply(merged, 1 / self.frames, out=merged)
+
+        np.add(merged, 0.5, out=merged)
+        np.clip(merged, 0, maxValue, out=merged)
+        np.copyto(out, merged, casting="unsafe")
+        return out
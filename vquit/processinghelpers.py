@@ -4,13 +4,11 @@ from multiprocessing import Process, Queue, Lock, Value, Array
 
 class Helpers:
     analysisHelpers = []  # Object to store all analyze helpers
-    idleAnalysisHelpers = 0  # Number of idle analysis helpers
     pendingReturns = 0
 
     Main_Process = None
 
     # Communication objects that need to be reset per run
-    idleAnalysisHelpers_Vars = None  # Check number of idle analysis helpers
     terminate_Vars = None  # Terminate main program
     mainProcessFinished_Vars = None  # Terminate children
 
@@ -20,7 +18,9 @@ class Helpers:
         from vquit import Configuration
         Config_module = Configuration()
 
-        self.helperTimeout = Config_module.Get("ImageProcessing")["HelperTimeout"]
+        helperPool = Config_module.Get("ImageProcessing")["HelperPool"]
+        self.helperPoolSize = helperPool["Size"]
+        self.helperPreload = helperPool["Preload"]
         self.n_cameras = Config_module.Get("QuickSettings")["ActiveCameras"]
 
         self.mainProcess = mainProcess  # Function which is run by analysis helpers
@@ -41,6 +41,28 @@ class Helpers:
         self.imagesIn_Vars = (Lock(), Queue())  # Send raw pictures to children
         self.dataOut_Vars = (Lock(), Queue())  # Retrieve processed pictures from children
 
+        # Images are passed through shared memory, the queues only carry references
+        sharedFrames = Config_module.Get("ImageProcessing")["SharedFrames"]
+        self.inputFrames = None
+        self.outputFrames = None
+        self.gridCanvases = {}
+        if sharedFrames["Enabled"] and sharedFrames["GridCanvas"]:
+            # Preview/archive grids are preallocated, cameras and helpers write into their own tile
+            # (one tile of SlotBytes per image of the grid layout)
+            from vquit.sharedframes import SharedGridCanvas
+            from vquit.imageprocessing import Image
+            canvasBytes = sharedFrames["SlotBytes"] * sum(len(row) for row in Image.GridLayout)
+            for name in ["Original", "Processed"]:
+                self.gridCanvases[name] = SharedGridCanvas(Image.GridLayout, canvasBytes)
+        elif sharedFrames["Enabled"]:
+            # Output slots hold the processed image and the converted original of every input slot
+            from vquit.sharedframes import SharedFrameRing
+            self.inputFrames = SharedFrameRing(sharedFrames["Slots"], sharedFrames["SlotBytes"])
+            self.outputFrames = SharedFrameRing(sharedFrames["Slots"] * 2, sharedFrames["SlotBytes"])
+
+        # Analysis helpers are started once at launch so the first scan does not wait for them
+        self.StartAnalysisPool()
+
     ############################
     # Graphical User Interface #
     ############################
@@ -55,9 +77,12 @@ class Helpers:
         return functions
 
     # Sent new image to GUI's preview window
-    def GUI_UpdatePreviewWindow(self, image):
+    # Skipped while the GUI has not taken the previous image yet when skipWhenBusy is set (live preview)
+    def GUI_UpdatePreviewWindow(self, image, skipWhenBusy=False):
         (lock, queue) = self.guiPreviewWindow_Vars
         with lock:
+            if skipWhenBusy and not queue.empty():
+                return
             queue.put(image)
 
     # Increase Progressbar in GUI
@@ -82,62 +107,91 @@ class Helpers:
     # AnalysisHelpers #
     ###################
 
-    # Increase (or decrease with negative number) number of idle helpers
-    def SetIdleAnalysisHelpers(self, addValue):
-        (lock, variable) = self.idleAnalysisHelpers_Vars
-        with lock:
-            variable.value += addValue
-
-    # Get number of idle helpers
-    def GetIdleAnalysisHelpers(self):
-        (lock, variable) = self.idleAnalysisHelpers_Vars
-        with lock:
-            idleHelpers = variable.value
-        return idleHelpers
-
-    # Check for idle helpers and create if not available
-    def RequestAnalysisHelper(self, n_helpers):
-        # Calculate number of new helpers to be created
-        newHelpers = n_helpers - self.GetIdleAnalysisHelpers()
-        if newHelpers > 0:
-            # Create new helpers
-            self.CreateAnalysisHelper(newHelpers)
-
-    # Create helper processes for analyzing images
-    def CreateAnalysisHelper(self, n_helpers):
+    # Create helper processes for analyzing images (they wait on imagesIn until StopAnalysisPool)
+    def StartAnalysisPool(self):
         # Bind variables
+        # Helpers only take images from the queue, the lock is used by the senders
+        (lock, imagesIn) = self.imagesIn_Vars
         communication_Vars = (
-            self.CheckTimeout, self.GUI_IncreaseProgressbar, self.imagesIn_Vars, self.SendProcessedData,
-            self.SetIdleAnalysisHelpers, self.GetFinishedFlag)
+            self.GUI_IncreaseProgressbar, imagesIn, self.ReadImage, self.SendProcessedData, self.OutputTile,
+            self.helperPreload)
 
-        print("Creating " + str(n_helpers) + " new analysis helpers")
+        print("Creating " + str(self.helperPoolSize) + " analysis helpers")
 
         # Create child processes
-        for _ in range(0, n_helpers):
+        for _ in range(0, self.helperPoolSize):
             newHelper = Process(target=self.analysisProcess, args=(communication_Vars,))
+            newHelper.daemon = True
             newHelper.start()
             self.analysisHelpers.append(newHelper)
 
-    # Send processed image to main process
-    def SendProcessedData(self, dataID, outputImage):
-        (lock, queue) = self.dataOut_Vars
+    # Stop all helpers with a sentinel per helper (images that are already queued are processed first)
+    def StopAnalysisPool(self):
+        (lock, queue) = self.imagesIn_Vars
 
+        print("Waiting on subprocess to be terminated...", end='\r')
         with lock:
-            queue.put([dataID, outputImage])
+            for _ in self.analysisHelpers:
+                queue.put(None)
 
-    # Check if main process is finished
-    def GetFinishedFlag(self):
-        (lock, variable) = self.mainProcessFinished_Vars
-        with lock:
-            updatedFlag = variable.value
-        return updatedFlag
+        for helper in self.analysisHelpers:
+            # Prevent script from exiting before children are finished
+            helper.join()
+        self.analysisHelpers = []
+
+        # Free shared memory
+        for frames in [self.inputFrames, self.outputFrames] + list(self.gridCanvases.values()):
+            if frames is not None:
+                frames.Close()
+                frames.Unlink()
+        self.gridCanvases = {}
+
+    # Shared grid canvas of the original or processed images (None when grids are not kept in shared memory)
+    def GridCanvas(self, name):
+        return self.gridCanvases.get(name)
+
+    # Tile of an image in a grid canvas, helpers write their output into it (None when there is no tile)
+    def OutputTile(self, name, dataID, shape, dtype):
+        canvas = self.GridCanvas(name)
+        if canvas is None or dataID not in canvas.positions:
+            return None
+        return canvas.Tile(dataID, shape, dtype)
+
+    # Image sent by SendRawImages (read by the helpers)
+    def ReadImage(self, image):
+        if "Original" in self.gridCanvases:
+            image = self.gridCanvases["Original"].Read(image)
+        if self.inputFrames is None:
+            return image
+        return self.inputFrames.Read(image)
+
+    # Send processed image to main process (and the converted original through shared memory when raw images were sent)
+    # Images are written to the output slots of the input slot of the image when shared memory is used
+    # Images that were written into their tile of a grid canvas (see OutputTile) are only referenced
+    def SendProcessedData(self, dataID, outputImage, originalImage=None, slot=None):
+        (lock, queue) = self.dataOut_Vars
 
-    # Check analysis helpers for timeout
-    def CheckTimeout(self, idleTime):
-        if idleTime > self.helperTimeout:
-            return True
-        else:
-            return False
+        outputImage = self.ShareImage("Processed", outputImage, slot * 2 if slot is not None else None)
+        if originalImage is not None:
+            originalImage = self.ShareImage("Original", originalImage, slot * 2 + 1 if slot is not None else None)
+
+            # Originals are only returned through shared memory, the main process converts the others itself
+            from vquit.sharedframes import SharedFrame
+            if not isinstance(originalImage, SharedFrame):
+                originalImage = None
+
+        with lock:
+            queue.put([dataID, outputImage, originalImage])
+
+    # Reference to an image in shared memory (a tile of the grid canvas or a copy in an output slot)
+    def ShareImage(self, name, image, slot):
+        if name in self.gridCanvases:
+            reference = self.gridCanvases[name].Reference(image)
+            if reference is not None:
+                return reference
+        if self.outputFrames is None:
+            return image
+        return self.outputFrames.Write(slot, image)
 
     ################
     # Main Process #
@@ -150,7 +204,7 @@ class Helpers:
             self.SendRawImages, self.GetProcessedData, self.GetProductID, self.UpdateToolState,
             self.GUI_ResetProgressbar,
             self.GUI_IncreaseProgressbar, self.GUI_UpdatePreviewWindow, self.UpdateTerminationFlag,
-            self.SetFinishedFlag)
+            self.SetFinishedFlag, self.GridCanvas)
 
         # Create process
         self.Main_Process = Process(target=self.mainProcess, args=(communication_Vars,))
@@ -169,7 +223,6 @@ class Helpers:
     # Reset parameters if the code has been run before
     def ResetMain(self):
         # self.GUI_SetBatchSizeRemaining(batchSize)
-        self.idleAnalysisHelpers_Vars = (Lock(), Value('i', 0))  # Reset number of idle analysis helpers
         self.terminate_Vars = (Lock(), Value('i', 0))  # Terminate main program
         self.mainProcessFinished_Vars = (Lock(), Value('b', False))  # Terminate children
 
@@ -204,17 +257,30 @@ class Helpers:
             variable.value = True
 
     # Insert all images in queue to children
-    def SendRawImages(self, images):
+    # Pass the flip code of every image as orientations when sending raw BayerRG images
+    def SendRawImages(self, images, orientations=None):
         (lock, queue) = self.imagesIn_Vars
 
-        # Request an idle helper per image
-        self.RequestAnalysisHelper(len(images))
-
         # Create data ID (used to sort asynchronous return values)
         dataID = 0
         for data in images:
+            orientation = None
+            if orientations is not None:
+                orientation = orientations[dataID]
+
+            # Images captured into the original grid canvas are only referenced, others are copied to shared memory
+            slot = None
+            reference = None
+            if "Original" in self.gridCanvases:
+                reference = self.gridCanvases["Original"].Reference(data)
+            if reference is not None:
+                data = reference
+            elif self.inputFrames is not None:
+                slot = self.inputFrames.Next()
+                data = self.inputFrames.Write(slot, data)
+
             with lock:
-                queue.put([dataID, data])
+                queue.put([dataID, data, orientation, slot])
 
             # Update expected returns from children
             self.pendingReturns += 1
@@ -236,39 +302,45 @@ class Helpers:
             array[1] = int(sn)
 
     # Retrieve data from children
-    def GetProcessedData(self):
+    # Returns (processed images, original images) when includeOriginals is set (used with raw images)
+    # Originals that did not fit in shared memory are None
+    # Images in shared memory are only valid until the next images are sent
+    def GetProcessedData(self, includeOriginals=False):
         (lock, queue) = self.dataOut_Vars
 
         print("Waiting for helpers...", end='\r')
         returnedData = []
-        # Keep looking for returned data from children until all expected returns are received or until terminate is called
+        # Wait for returned data from children until all expected returns are received
         while self.pendingReturns > 0:
-            # Reset image
-            newData = None
-
-            # Check for new image in queue
-            with lock:
-                if queue.empty() is False:
-                    newData = queue.get()
-
-            # Append result if available
-            if newData is not None:
-                returnedData.append(newData)
+            returnedData.append(queue.get())
 
-                # Update expected returns from children
-                self.pendingReturns -= 1
+            # Update expected returns from children
+            self.pendingReturns -= 1
 
         print("Processing incoming data from helpers...", end='\r')
 
         # Sort returned data by dataID
         returnedData = sorted(returnedData, key=lambda x: x[0])
 
+        # Resolve images in shared memory
+        for data in returnedData:
+            if "Processed" in self.gridCanvases:
+                data[1] = self.gridCanvases["Processed"].Read(data[1])
+                data[2] = self.gridCanvases["Original"].Read(data[2])
+            if self.outputFrames is not None:
+                data[1] = self.outputFrames.Read(data[1])
+                data[2] = self.outputFrames.Read(data[2])
+
         # Disregard dataID
         for dataID in returnedData:
             del dataID[0]
 
         # Extract images
         returnedImages = [image[0] for image in returnedData]
+
+        if includeOriginals:
+            originalImages = [image[1] for image in returnedData]
+            return returnedImages, originalImages
         return returnedImages
 
     # Terminate children
@@ -295,11 +367,6 @@ class Helpers:
         # Prevent script from exiting before main process is finished
         self.Main_Process.join()
 
-        print("Waiting on subprocess to be terminated...", end='\r')
-        # Prevent script from exiting before subVariable is finished
-        for helper in self.analysisHelpers:
-            # Prevent script from exiting before children are finished
-            helper.join()
-
+        # Analysis helpers keep running for the next run (see StopAnalysisPool)
         print("Processes properly terminated")
         return
@@ -1,12 +1,19 @@
 # Raspberry Pi remote access
 class RaspberryPi:
+    # Packages
+    copy = None
+    json = None
 
     # Function runs when initializing class
     # Connect to Raspberry and configure I/O
     def __init__(self, Config_module=None, TerminationCheck=None):
         # Import time library
-        from time import sleep
+        from time import sleep, perf_counter
+        import threading
         self.sleep = sleep
+        self.perf_counter = perf_counter
+
+        self.FileConfig = Config_module
 
         # Get parameters from configuration file
         ssh_Config = Config_module.Get("Raspberry")["SSH"]
@@ -15,28 +22,78 @@ class RaspberryPi:
         ssh_User = ssh_Config["User"]
         ssh_Pass = ssh_Config["Pass"]
         self.lightingConfig = Config_module.Get("Lighting")
+        self.n_camera = Config_module.Get("QuickSettings")["ActiveCameras"]
+
+        # Lighting states compiled into pigpio scripts (scene name: script) and the scripts stored on the Raspberry
+        # (script: script id, least recently used first, scenes with the same pins share a script)
+        self.scenesEnabled = self.lightingConfig["Scenes"]["Enabled"]
+        self.maxScenes = self.lightingConfig["Scenes"]["MaxScripts"]
+        self.sceneScripts = {}
+        self.scenes = {}
+
+        # Compiled lighting per acode (see SetLightingConfig)
+        self.lightingTables = {}
+
+        # Cameras lit and exposed together (Off: one cycle per camera | Identical: cameras with the same lights)
+        self.groupingMode = self.lightingConfig["Grouping"]["Mode"]
+
+        # Wait until lights are on/off (Fixed: fixed delay | Feedback: confirmation pin | Calibrated: settle time
+        # per pin)
+        settling = self.lightingConfig["Settling"]
+        self.settlingMode = settling["Mode"]
+        self.fixedDelay = settling["FixedDelay"]
+        self.feedbackPin = settling["FeedbackPin"]
+        self.feedbackTimeout = settling["FeedbackTimeout"]
+        self.settleTimesFile = settling["File"]
+        self.settleTimes = self.ReadSettleTimes()
+        self.settled = threading.Event()
+        self.settled.set()
+
+        # Last duty cycle written to every pin (lights already in the requested state need no settling)
+        self.dutyCycles = {}
+
+        # pigpio daemon (Attach: reuse a running daemon, restart when it does not respond | Restart: always restart)
+        daemon = Config_module.Get("Raspberry")["Daemon"]
+        self.daemonMode = daemon["Mode"]
+        self.daemonStopOnDisconnect = daemon["StopOnDisconnect"]
+        self.daemonTimeout = daemon["StartTimeout"]
+        self.daemonPollInterval = daemon["PollInterval"]
+
+        # Duration of every startup step in seconds
+        self.startupTimes = {}
+        startupStart = perf_counter()
+
+        # Simulated Raspberry (pigpio daemon and SSH terminal in this process)
+        simulation = Config_module.Get("Raspberry")["Simulation"]
+        self.simulated = simulation["Mode"] == "On"
+
+        if self.simulated:
+            print("Simulating Raspberry IO")
+            from vquit.simulatedraspberry import SimulatedGPIO, SimulatedSSH
+            self.gpio = SimulatedGPIO(feedbackPin=self.feedbackPin,
+                                      settleTimes={int(pin): settleTime for pin, settleTime in
+                                                   simulation["SettleTimes"].items()},
+                                      defaultSettleTime=simulation["DefaultSettleTime"],
+                                      latency=simulation["Latency"], daemonRunning=simulation["DaemonRunning"],
+                                      daemonStartTime=simulation["DaemonStartTime"])
+            self.ssh = SimulatedSSH(self.gpio, handshake=simulation["SSHHandshake"],
+                                    latency=simulation["SSHLatency"], persistent=True)
+        else:
+            # Setting up SSH class (connects on first use and stays connected until Disconnect)
+            self.ssh = SSH(ip, ssh_Port, ssh_User, ssh_Pass, TerminationCheck, persistent=True)
 
-        # Setting up SSH class
-        self.ssh = SSH(ip, ssh_Port, ssh_User, ssh_Pass, TerminationCheck)
-
-        # Kill any leftovers from previous instances and restart GPIO Daemon
-        print('Initializing Raspberry IO via SSH...', end='\r')
-        with self.ssh:
-            self.StopDaemon()
-            sleep(2)
-            self.StartDaemon()
-
-        # Raspberry GPIO controller
-        print("Importing PiGPIO module")
-        import pigpio as gpio
-        self.gpio = gpio
+            # Raspberry GPIO controller
+            print("Importing PiGPIO module")
+            import pigpio as gpio
+            self.gpio = gpio
 
         # Connect to pi gpio
         print('Connecting to Raspberry IO...', end='\r')
-        self.rpi = self.gpio.pi(ip)  # VQuIT-RemoteIO
+        self.rpi = self.AttachDaemon(ip)  # VQuIT-RemoteIO
 
         # Setup pin configuration
         print("Setting up Raspberry PinModes...", end="\r")
+        start = perf_counter()
         try:
             # Setup active GPIO pins
             for row in self.lightingConfig["PinID"]:
@@ -48,19 +105,58 @@ class RaspberryPi:
             print(
                 "\nError connecting to Raspberry.\nCheck if VQuIT_Config.json>Raspberry>IP_addr has the same IP as inet when running 'ifconfig' on the Raspberry\n")
         print(" ", end='\n')
+        self.startupTimes["Pins"] = perf_counter() - start
+
+        # Listen to the confirmation pin of the light driver
+        if self.feedbackPin != 0:
+            self.PinMode(self.feedbackPin, 'input')
+            self.feedbackCallback = self.rpi.callback(self.feedbackPin, self.gpio.RISING_EDGE,
+                                                      lambda gpio, level, tick: self.settled.set())
+
+        # Measure settle times once with the confirmation pin (stored in VQuIT_Config.json>Lighting>Settling>File)
+        if self.settlingMode == "Calibrated" and len(self.settleTimes) == 0 and self.feedbackPin != 0:
+            start = perf_counter()
+            self.CalibrateSettling()
+            self.startupTimes["Calibration"] = perf_counter() - start
+
+        # Lighting commands run in order on their own thread, callers only wait for the commands they depend on
+        self.controller = LightingController()
+        self.controller.Start()
+
+        # Timing breakdown
+        self.startupTimes["Total"] = perf_counter() - startupStart
+        print("Raspberry startup times: " + " | ".join(
+            step + " " + "{0:.3f}".format(duration) + " s" for step, duration in self.startupTimes.items()))
+
+    def ImportCopy(self):
+        if self.copy is None:
+            import copy
+            self.copy = copy
+        return self.copy
+
+    def ImportJSON(self):
+        if self.json is None:
+            import json
+            self.json = json
+        return self.json
 
     def Disconnect(self, terminationFlag):
-        # Turn off lights
-        self.DisableLights()
+        # Turn off lights once every queued command is done
+        self.DisableLights().result()
+        self.controller.Queue(self.DeleteScenes).result()
+        self.controller.Stop()
 
         # Disconnect IO
         print("Disconnecting from Raspberry IO...", end="\r")
+        if self.feedbackPin != 0:
+            self.feedbackCallback.cancel()
         self.rpi.stop()
 
-        # Stop GPIO Daemon
-        print("Stopping Raspberry IO via SSH...", end="\r")
-        with self.ssh:
-            self.StopDaemon()
+        # Stop GPIO Daemon (left running by default so the next start can attach to it)
+        if self.daemonStopOnDisconnect:
+            print("Stopping Raspberry IO via SSH...", end="\r")
+            with self.ssh:
+                self.StopDaemon()
 
         # # Ask user whether to shutdown or disconnect the Raspberry
         # shutdownPrompt = input("Shutdown Raspberry? (y/n)")
@@ -76,6 +172,9 @@ class RaspberryPi:
             with self.ssh:
                 self.ShutdownPi()
 
+        # Close pooled SSH connection
+        self.ssh.Close()
+
     # Define IO type
     def PinMode(self, pin, state):
         if state is 'input':
@@ -103,23 +202,161 @@ class RaspberryPi:
 
     def PWM(self, pin, dutyCycle):
         self.rpi.set_PWM_dutycycle(pin, dutyCycle)
+        self.dutyCycles[pin] = dutyCycle
 
     pwmData = []
+    acode = None
+
+    # Lighting of the selected product: (scene name, [(pin, duty cycle), ...], settle time) per camera per state
+    # (0: off, 1: on), the same per group of cameras and the capture schedules (see ScheduleCameras)
+    lightingTable = []
+    lightingGroups = {}
+    captureSchedules = {}
 
+    # Cameras share their light sources per row of 2 cameras
+    cameraRows = 4
+
+    # Select lighting of a product (compiled once per acode, scenes of products used before are already on the Pi)
+    # Returns a future, commands queued later use the lighting of this product
     def SetLightingConfig(self, productInfo):
-        self.pwmData = productInfo["Configuration"]
+        return self.controller.Queue(self.SelectLighting, productInfo)
 
+    def SelectLighting(self, productInfo):
+        self.pwmData = productInfo["Configuration"]
+        self.acode = productInfo["Acode"]
+
+        # Recompile when the lighting of the product has been changed since it was compiled
+        source = [self.pwmData["TopCameras"]["Lighting"], self.pwmData["BottomCameras"]["Lighting"]]
+        compiled = self.lightingTables.get(self.acode)
+        if compiled is None or compiled["Source"] != source:
+            compiled = {"Source": self.ImportCopy().deepcopy(source), "Table": self.CompileLighting(), "Groups": {},
+                        "Schedules": {}}
+            self.lightingTables[self.acode] = compiled
+
+            # Store scenes of the active cameras on the Raspberry
+            for cameraID in range(0, self.n_camera):
+                for (name, pins, settleTime) in compiled["Table"][cameraID]:
+                    self.UploadScene(self.sceneScripts[name])
+
+        self.lightingTable = compiled["Table"]
+        self.lightingGroups = compiled["Groups"]
+        self.captureSchedules = compiled["Schedules"]
+
+    # Switch lights of a camera or a group of cameras (see ScheduleCameras) with a single command (replays the
+    # compiled table of the product)
+    # Returns a future that is done once the lights have settled
     def SetCameraLighting(self, cameraID, state):
-        # Convert cameraID to camera row
-        if cameraID < 2:
-            cameraRow = 0
-        elif cameraID < 4:
-            cameraRow = 1
-        elif cameraID < 6:
-            cameraRow = 2
-        elif cameraID < 8:
-            cameraRow = 3
+        return self.controller.Queue(self.SwitchCameraLighting, cameraID, state)
+
+    def SwitchCameraLighting(self, cameraID, state):
+        if isinstance(cameraID, (list, tuple)):
+            if len(cameraID) == 1:
+                (name, pins, settleTime) = self.lightingTable[cameraID[0]][state]
+            else:
+                (name, pins, settleTime) = self.GroupLighting(cameraID)[state]
+        else:
+            (name, pins, settleTime) = self.lightingTable[cameraID][state]
+
+        # Lights are already in the requested state
+        if all(self.dutyCycles.get(pinID) == pwmValue for (pinID, pwmValue) in pins):
+            return
+
+        start = self.perf_counter()
+        self.settled.clear()
+        self.ApplyScene(name, pins)
+        self.Settle(start, settleTime)
+
+    # Compile lighting of the selected product into a scene per camera and state
+    def CompileLighting(self):
+        table = []
+        for cameraID in range(0, self.cameraRows * 2):
+            states = []
+            for state in [0, 1]:
+                pins = self.CameraPins(cameraID, state)
+                states.append((self.DefineScene(self.CameraSceneName(cameraID, state), pins), pins,
+                               self.SettleTime(pins)))
+            table.append(states)
+        return table
+
+    # Lighting of a group of cameras: every light of every camera in the group (compiled once per group)
+    def GroupLighting(self, cameraIDs):
+        key = tuple(cameraIDs)
+        states = self.lightingGroups.get(key)
+        if states is None:
+            states = []
+            for state in [0, 1]:
+                pins = {}
+                for cameraID in cameraIDs:
+                    for (pinID, pwmValue) in self.lightingTable[cameraID][state][1]:
+                        pins.setdefault(pinID, pwmValue)
+                pins = list(pins.items())
+                name = str(self.acode) + ":Group" + ",".join(str(cameraID) for cameraID in cameraIDs) + ":" + (
+                    "On" if state else "Off")
+                states.append((self.DefineScene(name, pins), pins, self.SettleTime(pins)))
+            self.UploadScene(self.sceneScripts[states[0][0]])
+            self.UploadScene(self.sceneScripts[states[1][0]])
+            self.lightingGroups[key] = states
+        return states
+
+    # Cameras can be exposed together when they use the same lights, so every camera is still exposed with exactly
+    # its own lights (a pin that is missing from a scene is off)
+    def SameLighting(self, cameraA, cameraB):
+        if self.groupingMode != "Identical":
+            return False
+
+        pinsA = dict(self.lightingTable[cameraA][1][1])
+        pinsB = dict(self.lightingTable[cameraB][1][1])
+        return all(pinsA.get(pinID, 0) == pinsB.get(pinID, 0) for pinID in set(pinsA) | set(pinsB))
+
+    # Split cameras into groups that are lit once and triggered together (first group that fits every camera,
+    # computed once per product and list of cameras)
+    def ScheduleCameras(self, cameraIDs):
+        return self.controller.Queue(self.PlanSchedule, cameraIDs).result()
+
+    def PlanSchedule(self, cameraIDs):
+        key = tuple(cameraIDs)
+        schedule = self.captureSchedules.get(key)
+        if schedule is not None:
+            return schedule
+
+        schedule = []
+        for cameraID in cameraIDs:
+            for group in schedule:
+                if all(self.SameLighting(cameraID, member) for member in group):
+                    group.append(cameraID)
+                    break
+            else:
+                schedule.append([cameraID])
+        self.captureSchedules[key] = schedule
+
+        # Expected time of a cycle: lights on + longest exposure + lights off
+        cameraTimes = [self.CycleTime([cameraID]) for cameraID in cameraIDs]
+        groupTimes = [self.CycleTime(group) for group in schedule]
+        print("Capture schedule for acode " + str(self.acode) + ": " + " | ".join(
+            "[" + ", ".join(str(cameraID) for cameraID in group) + "]" for group in schedule) + " (" + str(
+            len(schedule)) + " of " + str(len(cameraIDs)) + " cycles, expected " + "{0:.3f}".format(
+            sum(groupTimes)) + " s instead of " + "{0:.3f}".format(sum(cameraTimes)) + " s, saves " + "{0:.3f}".format(
+            sum(cameraTimes) - sum(groupTimes)) + " s)")
+        return schedule
+
+    # Expected duration of a single light and expose cycle of a group of cameras in seconds
+    def CycleTime(self, cameraIDs):
+        if len(cameraIDs) == 1:
+            states = self.lightingTable[cameraIDs[0]]
         else:
+            states = self.GroupLighting(cameraIDs)
+        exposure = max(self.pwmData["BottomCameras" if cameraID % 2 == 0 else "TopCameras"]["ExposureTime"]
+                       for cameraID in cameraIDs) / 1000000
+        return states[1][2] + exposure + states[0][2]
+
+    def CameraSceneName(self, cameraID, state):
+        return str(self.acode) + ":Camera" + str(cameraID) + ":" + ("On" if state else "Off")
+
+    # (pin, duty cycle) of every light used by a camera
+    def CameraPins(self, cameraID, state):
+        # Convert cameraID to camera row
+        cameraRow = int(cameraID / 2)
+        if cameraRow >= self.cameraRows:
             raise ValueError("Invalid camera row for cameraID:" + str(cameraID))
 
         if (cameraID % 2) == 0:
@@ -133,6 +370,8 @@ class RaspberryPi:
         topLightsPWM = self.pwmData[cameraPosition]["Lighting"]["U"]
         bottomLightsPWM = self.pwmData[cameraPosition]["Lighting"]["D"]
 
+        pins = []
+
         for absLightID in range(0, len(topLightsPWM)):
             # Bottom lights
             pwmValue = bottomLightsPWM[absLightID]
@@ -151,7 +390,7 @@ class RaspberryPi:
                 if pinID is not 0:
                     if state == 0:
                         pwmValue = 0
-                    self.PWM(pinID, pwmValue)
+                    pins.append((pinID, pwmValue))
 
             # Top lights
             pwmValue = topLightsPWM[absLightID]
@@ -170,48 +409,266 @@ class RaspberryPi:
                 if pinID is not 0:
                     if state == 0:
                         pwmValue = 0
-                    self.PWM(pinID, pwmValue)
+                    pins.append((pinID, pwmValue))
 
-        # Small delay to ensure the lights are on, ideally this would be replaced with feedback from the MCU
-        self.sleep(0.05)
+        return pins
+
+    # Registered pins of all lights
+    def AllPins(self):
+        pins = []
+        for row in self.lightingConfig["PinID"]:
+            for pinID in self.lightingConfig["PinID"][row]:
+                if pinID is not 0:
+                    pins.append(pinID)
+        return pins
 
     # Enable light sources to create power surge before capturing process (replaced by IdleLights)
     def KickstartLights(self):
-        pwmValue = 100
-        for i in range(0, 2):
-            for row in self.lightingConfig["PinID"]:
-                for pinID in self.lightingConfig["PinID"][row]:
-                    if pinID is not 0:
-                        self.PWM(pinID, pwmValue)
-            pwmValue = 0
+        return self.controller.Queue(self.SwitchKickstart)
 
-    # Set all lights to specific value
+    def SwitchKickstart(self):
+        pins = [(pinID, 100) for pinID in self.AllPins()]
+
+        # Hold full power until the lights have settled before switching them off
+        start = self.perf_counter()
+        self.settled.clear()
+        self.SwitchAllLights(100)
+        self.Settle(start, self.SettleTime(pins))
+        self.SwitchAllLights(0)
+
+    # Set all lights to specific value (returns a future)
     def SetAllLights(self, value):
-        for row in self.lightingConfig["PinID"]:
-            for pinID in self.lightingConfig["PinID"][row]:
-                if pinID is not 0:
-                    self.PWM(pinID, value)
+        return self.controller.Queue(self.SwitchAllLights, value)
+
+    def SwitchAllLights(self, value):
+        name = "All:" + str(value)
+        pins = [(pinID, value) for pinID in self.AllPins()]
+        if name not in self.sceneScripts:
+            self.DefineScene(name, pins)
+
+        self.ApplyScene(name, pins)
 
     # Set lights in idle mode
     def IdleLights(self):
-        self.SetAllLights(50)
+        return self.SetAllLights(50)
 
     # Turn of lights
     def DisableLights(self):
-        self.SetAllLights(0)
+        return self.SetAllLights(0)
+
+    ############
+    # Settling #
+    ############
+
+    # Wait until lights switched at start are on/off
+    def Settle(self, start, settleTime):
+        if self.settlingMode == "Feedback" and self.feedbackPin != 0:
+            # Confirmation pin of the light driver
+            if not self.settled.wait(self.feedbackTimeout):
+                print("Lights not confirmed within " + str(self.feedbackTimeout) + " s")
+        elif self.settlingMode == "Calibrated":
+            # Only wait for the part of the settle time that is left
+            remaining = settleTime - (self.perf_counter() - start)
+            if remaining > 0:
+                self.sleep(remaining)
+        else:
+            # Fixed delay to ensure the lights are on
+            self.sleep(self.fixedDelay)
+
+    # Settle time of a scene (slowest light, fixed delay for lights that have not been calibrated)
+    def SettleTime(self, pins):
+        settleTime = 0
+        for (pinID, pwmValue) in pins:
+            settleTime = max(settleTime, self.settleTimes.get(pinID, self.fixedDelay))
+        return settleTime
+
+    # Measure the time every light needs to settle with the confirmation pin and store the results
+    def CalibrateSettling(self, samples=5, margin=0.2):
+        if self.feedbackPin == 0:
+            print("No Lighting>Settling>FeedbackPin to calibrate settle times with, using fixed delay")
+            return
+
+        print("Calibrating light settle times...", end="\r")
+        settleTimes = {}
+        for pinID in self.AllPins():
+            measured = []
+            for sample in range(0, samples):
+                for pwmValue in [255, 0]:
+                    # The confirmation pin only responds to lights that change
+                    if self.dutyCycles.get(pinID) == pwmValue:
+                        continue
+                    start = self.perf_counter()
+                    self.settled.clear()
+                    self.PWM(pinID, pwmValue)
+                    if not self.settled.wait(self.feedbackTimeout):
+                        print("Light on pin " + str(pinID) + " not confirmed within " + str(
+                            self.feedbackTimeout) + " s, using fixed delay")
+                        measured = None
+                        break
+                    measured.append(self.perf_counter() - start)
+                if measured is None:
+                    break
+
+            if measured is not None:
+                settleTimes[pinID] = max(measured) * (1 + margin)
+                print("Light on pin " + str(pinID) + " settles in " + "{0:.4f}".format(settleTimes[pinID]) + " s")
+
+        self.settleTimes = settleTimes
+        self.WriteSettleTimes()
+
+    # Read calibrated settle times (pin: seconds, empty when the lights have not been calibrated yet)
+    def ReadSettleTimes(self):
+        json = self.ImportJSON()
+        from os import path
+
+        if not path.isfile(self.settleTimesFile):
+            return {}
+        with open(self.settleTimesFile, 'r') as file:
+            return {int(pinID): settleTime for pinID, settleTime in json.load(file).items()}
+
+    # Write calibrated settle times
+    def WriteSettleTimes(self):
+        json = self.ImportJSON()
+
+        with open(self.settleTimesFile, 'w') as file:
+            json.dump({str(pinID): settleTime for pinID, settleTime in self.settleTimes.items()}, file)
+
+    ##########
+    # Scenes #
+    ##########
+
+    # pigpio script that sets the duty cycle of every pin in order
+    @staticmethod
+    def CompileScene(pins):
+        return " ".join(["pwm " + str(pinID) + " " + str(pwmValue) for (pinID, pwmValue) in pins])
+
+    # Compile the pins of a scene into a pigpio script (returns the scene name)
+    def DefineScene(self, name, pins):
+        self.sceneScripts[name] = self.CompileScene(pins)
+        return name
+
+    # Store a script on the Raspberry once (returns False when pigpio rejects the script)
+    def UploadScene(self, script):
+        if not self.scenesEnabled:
+            return False
+
+        if script in self.scenes:
+            # Mark as recently used
+            self.scenes[script] = self.scenes.pop(script)
+            return True
+
+        # The Raspberry only holds a limited number of scripts, drop the least recently used script
+        if len(self.scenes) >= self.maxScenes:
+            oldest = next(iter(self.scenes))
+            self.rpi.delete_script(self.scenes.pop(oldest))
+
+        try:
+            scriptID = self.rpi.store_script(script.encode())
+        except self.gpio.error as error:
+            print("Lighting scene '" + str(script) + "' rejected by the Raspberry (" + str(error) + ")")
+            return False
+
+        # Scripts can only run once pigpio is done checking them
+        while self.rpi.script_status(scriptID)[0] == self.gpio.PI_SCRIPT_INITING:
+            self.sleep(0.001)
+
+        self.scenes[script] = scriptID
+        return True
+
+    # Switch all pins of a scene with a single command (returns False when the scene is not available on the Pi)
+    def RunScene(self, name):
+        script = self.sceneScripts[name]
+
+        # Scene without lights
+        if script == "":
+            return True
+
+        if not self.UploadScene(script):
+            return False
+
+        self.rpi.run_script(self.scenes[script])
+        return True
+
+    # Switch the pins of a scene (falls back to a command per pin when the scene is not available on the Pi)
+    def ApplyScene(self, name, pins):
+        if self.RunScene(name):
+            for (pinID, pwmValue) in pins:
+                self.dutyCycles[pinID] = pwmValue
+        else:
+            for (pinID, pwmValue) in pins:
+                self.PWM(pinID, pwmValue)
+
+    # Remove all scenes from the Raspberry
+    def DeleteScenes(self):
+        for scriptID in self.scenes.values():
+            self.rpi.delete_script(scriptID)
+        self.scenes = {}
 
     #################
     # SSH Functions #
     #################
 
+    # Connect to the pigpio daemon, a daemon that does not respond is restarted via SSH
+    def AttachDaemon(self, ip):
+        if self.daemonMode == "Attach":
+            start = self.perf_counter()
+            rpi = self.gpio.pi(ip, show_errors=False)
+            healthy = self.DaemonHealthy(rpi)
+            self.startupTimes["Attach"] = self.perf_counter() - start
+
+            if healthy:
+                print("Attached to running pigpio daemon")
+                return rpi
+            rpi.stop()
+            print("pigpio daemon not responding, restarting it via SSH")
+
+        # Kill any leftovers from previous instances and restart GPIO Daemon
+        print('Initializing Raspberry IO via SSH...', end='\r')
+        start = self.perf_counter()
+        self.ssh.Connect()
+        self.startupTimes["SSH"] = self.perf_counter() - start
+
+        start = self.perf_counter()
+        self.StopDaemon()
+        self.startupTimes["Stop daemon"] = self.perf_counter() - start
+
+        start = self.perf_counter()
+        self.StartDaemon()
+        rpi = self.WaitForDaemon(ip)
+        self.startupTimes["Start daemon"] = self.perf_counter() - start
+        return rpi
+
+    # Daemon is connected and answers commands
+    def DaemonHealthy(self, rpi):
+        if not rpi.connected:
+            return False
+        try:
+            rpi.get_current_tick()
+            return True
+        except Exception:
+            return False
+
+    # Connect as soon as a started daemon accepts connections (instead of a fixed delay)
+    def WaitForDaemon(self, ip):
+        deadline = self.perf_counter() + self.daemonTimeout
+        while True:
+            rpi = self.gpio.pi(ip, show_errors=False)
+            if self.DaemonHealthy(rpi) or self.perf_counter() >= deadline:
+                return rpi
+            rpi.stop()
+            self.sleep(self.daemonPollInterval)
+
     # Start Daemon to use Raspberry GPIO
     def StartDaemon(self):
-        self.ssh.Send('sudo pigpiod')
-        self.sleep(3)
+        self.ssh.Run('sudo pigpiod')
 
-    # Stop Daemon when done with Raspberry GPIO
+    # Stop Daemon when done with Raspberry GPIO (returns once the process is gone instead of after a fixed delay)
     def StopDaemon(self):
-        self.ssh.Send('sudo killall pigpiod')
+        self.ssh.Run('sudo killall pigpiod')
+
+        deadline = self.perf_counter() + self.daemonTimeout
+        while self.ssh.Run('pidof pigpiod') == 0 and self.perf_counter() < deadline:
+            self.sleep(self.daemonPollInterval)
 
     # Shutdown Raspberry when shutting down tool
     def ShutdownPi(self):
@@ -219,14 +676,68 @@ class RaspberryPi:
         self.ssh.Send('sudo shutdown -h now')
 
 
+# Runs lighting commands in order on a dedicated thread (pigpio round-trips and settle times do not block the caller)
+class LightingController:
+
+    # Function runs when initializing class
+    def __init__(self):
+        from concurrent.futures import Future
+        import threading
+        import queue
+
+        self.Future = Future
+        self.threading = threading
+        self.commands = queue.Queue()
+        self.thread = None
+
+    def Start(self):
+        self.thread = self.threading.Thread(target=self.Run, name="LightingController", daemon=True)
+        self.thread.start()
+
+    # Run every queued command before stopping
+    def Stop(self):
+        if self.thread is not None:
+            self.commands.put(None)
+            self.thread.join()
+            self.thread = None
+
+    # Queue a command, the returned future holds its result once the command has run
+    def Queue(self, function, *args):
+        future = self.Future()
+        if self.thread is None:
+            future.set_exception(RuntimeError("Lighting controller is not running"))
+        else:
+            self.commands.put((future, function, args))
+        return future
+
+    def Run(self):
+        while True:
+            command = self.commands.get()
+            if command is None:
+                break
+
+            (future, function, args) = command
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(function(*args))
+            except Exception as error:
+                # Nobody may be waiting on the future, report the error here as well
+                print("Lighting command " + function.__name__ + " failed (" + str(error) + ")")
+                future.set_exception(error)
+
+
 # Connect to clients via SSH
 class SSH:
 
     # Function runs when initializing class
-    def __init__(self, ip, port, username, password, TerminationCheck):
+    def __init__(self, ip, port, username, password, TerminationCheck, persistent=False):
         # Allow connection process to be terminated
         self.UpdateTerminationFlag = TerminationCheck
 
+        # Persistent connections stay open after a "with" statement until Close
+        self.persistent = persistent
+
         self.ip = ip
         self.port = port
         self.username = username
@@ -246,6 +757,25 @@ class SSH:
 
     # Function runs when using class in a "with" statement
     def __enter__(self):
+        self.Connect()
+        return self
+
+    # Function runs at the end of a "with" statement
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if not self.persistent:
+            self.Close()
+
+    def Connected(self):
+        if self.client is None:
+            return False
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    # Connect unless already connected
+    def Connect(self):
+        if self.Connected():
+            return
+
         print('Connecting to Raspberry terminal via SSH...', end='\r')
 
         self.client = self.ssh.SSHClient()
@@ -282,10 +812,11 @@ class SSH:
                 import sys
                 sys.exit("Raspberry connection interrupted with keyboard interrupt")
 
-    # Function runs at the end of a "with" statement
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        print("Stopping SSH connection...", end="\r")
-        self.client.close()
+    def Close(self):
+        if self.client is not None:
+            print("Stopping SSH connection...", end="\r")
+            self.client.close()
+            self.client = None
 
     def Send(self, command, printReturn=None):
 
@@ -300,3 +831,8 @@ class SSH:
             for line in stderr:
                 print('SSH: ' + line.strip('\n'))
         return stdout, stderr
+
+    # Run a command and return its exit status
+    def Run(self, command):
+        stdin, stdout, stderr = self.client.exec_command(command)
+        return stdout.channel.recv_exit_status()
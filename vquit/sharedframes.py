@@ -0,0 +1,201 @@
+# Shared memory frame transport between the main process and the analysis helpers
+#
+# Frames are written into preallocated slots of a shared memory block, only a reference (slot, shape, dtype) goes
+# through the queues. Frames that do not fit in a slot are sent as they are (pickled through the queue).
+# Frames that are part of a grid (original and processed images) are written straight into their tile of a shared
+# grid canvas instead.
+
+
+# Fixed number of equally sized frame slots in a single shared memory block
+class SharedFrameRing:
+    # Packages
+    np = None
+
+    # Function runs when initializing class
+    def __init__(self, slots, slotBytes):
+        from multiprocessing import shared_memory
+
+        self.slots = slots
+        self.slotBytes = slotBytes
+        self.memory = shared_memory.SharedMemory(create=True, size=slots * slotBytes)
+
+        # Next slot handed out by Next (only used by the process that fills the ring)
+        self.cursor = 0
+
+    def ImportNumpy(self):
+        if self.np is None:
+            import numpy
+            self.np = numpy
+        return self.np
+
+    # Only the shared memory block is sent to child processes
+    def __getstate__(self):
+        return {"slots": self.slots, "slotBytes": self.slotBytes, "memory": self.memory, "cursor": self.cursor}
+
+    # Claim the next slot (slots are reused in order, a slot must be read before the ring wraps around)
+    def Next(self):
+        slot = self.cursor
+        self.cursor = (self.cursor + 1) % self.slots
+        return slot
+
+    # Array in shared memory at a slot
+    def View(self, slot, shape, dtype):
+        np = self.ImportNumpy()
+        return np.ndarray(shape, dtype=dtype, buffer=self.memory.buf, offset=slot * self.slotBytes)
+
+    # Copy an image into a slot, returns its reference or the image itself when it does not fit
+    def Write(self, slot, image):
+        if slot is None or image.nbytes > self.slotBytes:
+            return image
+
+        np = self.ImportNumpy()
+        np.copyto(self.View(slot, image.shape, image.dtype), image)
+        return SharedFrame(slot, image.shape, image.dtype.str)
+
+    # Image of a reference written by Write (images sent as they are are returned unchanged)
+    def Read(self, frame):
+        if isinstance(frame, SharedFrame) and not isinstance(frame, SharedTile):
+            return self.View(frame.slot, frame.shape, frame.dtype)
+        return frame
+
+    # Detach from the shared memory block (views returned by Read can not be used afterwards)
+    def Close(self):
+        self.memory.close()
+
+    # Free the shared memory block (called once by the process that created the ring)
+    def Unlink(self):
+        self.memory.unlink()
+
+
+# Reference to an image in a SharedFrameRing
+class SharedFrame:
+    __slots__ = ("slot", "shape", "dtype")
+
+    def __init__(self, slot, shape, dtype):
+        self.slot = slot
+        self.shape = shape
+        self.dtype = dtype
+
+    def __getstate__(self):
+        return self.slot, self.shape, self.dtype
+
+    def __setstate__(self, state):
+        (self.slot, self.shape, self.dtype) = state
+
+
+# Grid of equally sized images in a single shared memory block (same layout as Image.Grid)
+# Producers write straight into the tile of their image, the grid is complete once the last tile is written
+class SharedGridCanvas:
+    # Packages
+    np = None
+
+    # Function runs when initializing class
+    def __init__(self, layout, canvasBytes):
+        from multiprocessing import shared_memory
+
+        self.layout = layout
+        self.canvasBytes = canvasBytes
+        self.memory = shared_memory.SharedMemory(create=True, size=canvasBytes)
+
+        # Row and column of every image in the grid
+        self.rows = len(layout)
+        self.columns = len(layout[0])
+        self.positions = {}
+        for row in range(0, self.rows):
+            for column in range(0, self.columns):
+                self.positions[layout[row][column]] = (row, column)
+
+    def ImportNumpy(self):
+        if self.np is None:
+            import numpy
+            self.np = numpy
+        return self.np
+
+    # Only the shared memory block is sent to child processes
+    def __getstate__(self):
+        return {"layout": self.layout, "canvasBytes": self.canvasBytes, "memory": self.memory, "rows": self.rows,
+                "columns": self.columns, "positions": self.positions}
+
+    # Whole grid for tiles of a shape (None when the grid does not fit in the canvas)
+    def Canvas(self, tileShape, dtype):
+        np = self.ImportNumpy()
+
+        shape = (tileShape[0] * self.rows, tileShape[1] * self.columns) + tuple(tileShape[2:])
+        if int(np.prod(shape)) * np.dtype(dtype).itemsize > self.canvasBytes:
+            return None
+        return np.ndarray(shape, dtype=dtype, buffer=self.memory.buf)
+
+    # Tile of an image in the grid (None when the grid does not fit in the canvas)
+    def Tile(self, index, tileShape, dtype):
+        canvas = self.Canvas(tileShape, dtype)
+        if canvas is None:
+            return None
+
+        (row, column) = self.positions[index]
+        (height, width) = tileShape[:2]
+        return canvas[row * height:(row + 1) * height, column * width:(column + 1) * width]
+
+    # True when an image is stored in this canvas (the grid or one of its tiles)
+    def Contains(self, image):
+        if image is None or not hasattr(image, "ctypes"):
+            return False
+
+        address = image.ctypes.data
+        start = self.ImportNumpy().frombuffer(self.memory.buf, dtype="u1", count=1).ctypes.data
+        return start <= address < start + self.canvasBytes
+
+    # Index of the tile an image was written to (None when the image is not a tile of this canvas)
+    def TileIndex(self, image):
+        if not self.Contains(image):
+            return None
+
+        address = image.ctypes.data
+        for index in self.positions:
+            tile = self.Tile(index, image.shape, image.dtype)
+            if tile is not None and tile.ctypes.data == address and tile.strides == image.strides:
+                return index
+        return None
+
+    # Reference to a tile that can be sent through a queue (None when the image is not a tile of this canvas)
+    def Reference(self, image):
+        index = self.TileIndex(image)
+        if index is None:
+            return None
+        return SharedTile(index, image.shape, image.dtype.str)
+
+    # Tile of a reference written by Reference (other images are returned unchanged)
+    def Read(self, frame):
+        if isinstance(frame, SharedTile):
+            return self.Tile(frame.slot, frame.shape, frame.dtype)
+        return frame
+
+    # Grid of images (images that are not in their tile yet are copied, None when the grid does not fit)
+    def Grid(self, images):
+        np = self.ImportNumpy()
+
+        shape = images[0].shape
+        dtype = images[0].dtype
+        if len(images) != len(self.positions) or any(image.shape != shape or image.dtype != dtype for image in images):
+            return None
+
+        canvas = self.Canvas(shape, dtype)
+        if canvas is None:
+            return None
+
+        for index in range(0, len(images)):
+            if self.TileIndex(images[index]) != index:
+                np.copyto(self.Tile(index, shape, dtype), images[index])
+        return canvas
+
+    # Detach from the shared memory block (views returned by Canvas and Tile can not be used afterwards)
+    def Close(self):
+        self.memory.close()
+
+    # Free the shared memory block (called once by the process that created the canvas)
+    def Unlink(self):
+        self.memory.unlink()
+
+
+# Reference to a tile in a SharedGridCanvas (slot is the index of the image in the grid)
+class SharedTile(SharedFrame):
+    __slots__ = ()
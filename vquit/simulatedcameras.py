@@ -0,0 +1,394 @@
+# Simulated GigE cameras (replay recorded raw Bayer frames without a GenTL producer)
+#
+# Recordings are stored per camera in the order of VQuIT_Config.json>Cameras>Advanced:
+#   <Directory>/Camera<N>/Frame<K>.npy   raw BayerRG payload as fetched from the camera (packed formats in 1D)
+#   <Directory>/Camera<N>/Latency.json   seconds between trigger and buffer per frame (written when recording stops)
+
+
+# Raised when a simulated camera does not deliver a buffer in time (mirrors harvesters.core.TimeoutException)
+class SimulatedTimeoutException(Exception):
+    pass
+
+
+# Stand-in for harvesters.core.Harvester
+class SimulatedHarvester:
+
+    # Function runs when initializing class
+    def __init__(self, directory, cameraIDs):
+        self.directory = directory
+        self.cameraIDs = cameraIDs
+        self.device_info_list = []
+
+    # No GenTL producer is needed to replay frames
+    def add_file(self, file_path):
+        pass
+
+    # All configured cameras are always available
+    def update(self):
+        self.device_info_list = [SimulatedDeviceInfo(cameraID) for cameraID in self.cameraIDs]
+
+    def create_image_acquirer(self, id_=None):
+        if id_ not in self.cameraIDs:
+            raise ValueError("Simulated camera '" + str(id_) + "' not found")
+        return SimulatedCamera(self.directory, self.cameraIDs.index(id_))
+
+    def reset(self):
+        self.device_info_list = []
+
+
+# Stand-in for the device info objects of harvesters
+class SimulatedDeviceInfo:
+    def __init__(self, id_):
+        self.id_ = id_
+
+
+# Stand-in for harvesters.core.ImageAcquirer
+class SimulatedCamera:
+    # Packages
+    np = None
+    json = None
+    os = None
+
+    # Estimated transfer speed of a GigE link in bytes per second (used when no latencies are recorded)
+    linkSpeed = 100000000
+
+    num_buffers = 1
+
+    # Function runs when initializing class
+    def __init__(self, directory, camNr):
+        from time import sleep, perf_counter
+        import threading
+
+        self.sleep = sleep
+        self.perf_counter = perf_counter
+
+        self.camNr = camNr
+        self.remote_device = SimulatedDevice(self)
+
+        # Trigger times that have not been served with a buffer yet
+        self.triggers = []
+        self.triggerCondition = threading.Condition()
+        self.acquiring = False
+
+        # Start of the last free-running exposure
+        self.freeRunStart = 0
+
+        # Recorded frames
+        self.frameFiles, self.latencies = self.LoadRecording(directory)
+        self.frameIndex = 0
+        self.syntheticFrame = None
+
+    def ImportNumpy(self):
+        if self.np is None:
+            import numpy
+            self.np = numpy
+        return self.np
+
+    def ImportJSON(self):
+        if self.json is None:
+            import json
+            self.json = json
+        return self.json
+
+    def ImportOS(self):
+        if self.os is None:
+            import os
+            self.os = os
+        return self.os
+
+    # Find recorded frames and latencies of this camera
+    def LoadRecording(self, directory):
+        os = self.ImportOS()
+        json = self.ImportJSON()
+
+        path = os.path.join(directory, "Camera" + str(self.camNr))
+        if not os.path.isdir(path):
+            print("Camera " + str(self.camNr) + ": No recording found in " + str(path) + ", using synthetic frames")
+            return [], []
+
+        frameFiles = sorted([file for file in os.listdir(path) if file.startswith("Frame") and file.endswith(".npy")])
+        frameFiles = [os.path.join(path, file) for file in frameFiles]
+
+        latencies = []
+        latencyFile = os.path.join(path, "Latency.json")
+        if os.path.isfile(latencyFile):
+            with open(latencyFile, 'r') as file:
+                latencies = json.load(file)
+
+        print("Camera " + str(self.camNr) + ": Replaying " + str(len(frameFiles)) + " recorded frames")
+        return frameFiles, latencies
+
+    def start_acquisition(self):
+        self.acquiring = True
+
+    def stop_acquisition(self):
+        self.acquiring = False
+
+        # Pending triggers are lost when acquisition stops
+        with self.triggerCondition:
+            self.triggers = []
+
+    def destroy(self):
+        self.stop_acquisition()
+
+    # Called by the TriggerSoftware node
+    def Trigger(self):
+        if self.acquiring:
+            with self.triggerCondition:
+                self.triggers.append(self.perf_counter())
+                self.triggerCondition.notify_all()
+
+    # Return next frame and its latency
+    def NextFrame(self):
+        np = self.ImportNumpy()
+        nodeMap = self.remote_device.node_map
+
+        width = nodeMap.Width.value
+        height = nodeMap.Height.value
+
+        if len(self.frameFiles) > 0:
+            # Cycle through recorded frames
+            index = self.frameIndex % len(self.frameFiles)
+            self.frameIndex += 1
+
+            image = np.load(self.frameFiles[index])
+
+            # Bin full resolution recordings (every 4th 2x2 Bayer block keeps the BayerRG pattern)
+            if image.ndim == 2 and nodeMap.Binning.value == "Bayer4x4":
+                blocks = image.reshape(int(image.shape[0] / 2), 2, int(image.shape[1] / 2), 2)[::4, :, ::4, :]
+                image = blocks.reshape(blocks.shape[0] * 2, blocks.shape[2] * 2)
+
+            # Apply the requested ROI to full sensor recordings (packed recordings are stored as recorded)
+            if image.ndim == 2 and (image.shape[0] > height or image.shape[1] > width):
+                offsetX = min(nodeMap.OffsetX.value, image.shape[1] - width)
+                offsetY = min(nodeMap.OffsetY.value, image.shape[0] - height)
+                image = image[offsetY:offsetY + height, offsetX:offsetX + width]
+
+            if index < len(self.latencies):
+                return image, self.latencies[index]
+        else:
+            # Generate a frame at the requested resolution and pixel format once
+            if nodeMap.PixelFormat.value == "BayerRG12Packed":
+                shape = (int(height * width * 3 / 2),)
+            else:
+                shape = (height, width)
+            if self.syntheticFrame is None or self.syntheticFrame.shape != shape:
+                self.syntheticFrame = np.random.randint(0, 256, shape, dtype=np.uint8)
+            image = self.syntheticFrame
+
+        # Estimate latency from exposure and transfer time
+        latency = nodeMap.ExposureTimeRaw.value / 1000000 + image.nbytes / self.linkSpeed
+        return image, latency
+
+    # Start of the next exposure of a free-running camera (frames missed while not fetching are dropped)
+    def FreeRun(self):
+        period = self.remote_device.node_map.AcquisitionPeriod.value / 1000000
+        self.freeRunStart = max(self.freeRunStart + period, self.perf_counter() - period)
+        return self.freeRunStart
+
+    def fetch_buffer(self, timeout=0):
+        deadline = self.perf_counter() + timeout
+
+        # Wait for a trigger (Timed exposure mode runs without triggers)
+        with self.triggerCondition:
+            if self.acquiring and self.remote_device.node_map.ExposureMode.value == "Timed":
+                triggerTime = self.FreeRun()
+            else:
+                while len(self.triggers) == 0:
+                    remaining = deadline - self.perf_counter()
+                    if remaining <= 0 or not self.triggerCondition.wait(remaining):
+                        raise SimulatedTimeoutException("Simulated camera " + str(self.camNr) + " was not triggered")
+                triggerTime = self.triggers.pop(0)
+
+        image, latency = self.NextFrame()
+
+        # Deliver the buffer after the recorded latency or time out
+        arrival = triggerTime + latency
+        if arrival > deadline:
+            self.sleep(max(deadline - self.perf_counter(), 0))
+            raise SimulatedTimeoutException("Simulated camera " + str(self.camNr) + " missed the fetch deadline")
+        self.sleep(max(arrival - self.perf_counter(), 0))
+
+        return SimulatedBuffer(image, width=self.remote_device.node_map.Width.value,
+                               height=self.remote_device.node_map.Height.value, timestamp_ns=int(triggerTime * 1e9))
+
+
+# Remote device of a simulated camera
+class SimulatedDevice:
+    def __init__(self, camera):
+        self.node_map = SimulatedNodeMap(camera)
+
+
+# GenICam node map of a simulated camera (unknown nodes are created on first use)
+class SimulatedNodeMap:
+    # Node values that are read before they are written
+    defaults = {
+        "WidthMax": 4096,
+        "HeightMax": 3008,
+        "Width": 4096,
+        "Height": 3008,
+        "OffsetX": 0,
+        "OffsetY": 0,
+        "ExposureTimeRaw": 150000,
+        "DeviceTemperatureRaw": 4000,
+        "PixelFormat": "BayerRG8",
+        "Binning": "Disabled",
+        "ExposureMode": "TimedTriggered",
+        "AcquisitionPeriod": 102775
+    }
+
+    def __init__(self, camera):
+        self.__dict__["camera"] = camera
+
+    def __getattr__(self, name):
+        if name == "TriggerSoftware":
+            node = SimulatedNode(command=self.camera.Trigger)
+        else:
+            node = SimulatedNode(value=self.defaults.get(name))
+        self.__dict__[name] = node
+        return node
+
+
+# Single GenICam node
+class SimulatedNode:
+    def __init__(self, value=None, command=None):
+        self.value = value
+        self.command = command
+
+    def execute(self):
+        if self.command is not None:
+            self.command()
+
+
+# Buffer returned by SimulatedCamera.fetch_buffer
+class SimulatedBuffer:
+    def __init__(self, image, width, height, timestamp_ns=None):
+        self.payload = SimulatedPayload(image, width, height)
+
+        # Start of the exposure on the camera clock
+        self.timestamp_ns = timestamp_ns
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class SimulatedPayload:
+    def __init__(self, image, width, height):
+        self.components = [SimulatedComponent(image, width, height)]
+
+
+# Payload component (2D frames carry their own size, packed 1D data uses the ROI of the camera)
+class SimulatedComponent:
+    def __init__(self, image, width, height):
+        self.data = image
+        if image.ndim == 2:
+            height, width = image.shape
+        self.height = height
+        self.width = width
+
+
+# Store raw frames of a live session so they can be replayed by SimulatedCamera
+class FrameRecorder:
+    np = None
+    json = None
+    os = None
+
+    # Function runs when initializing class
+    def __init__(self, directory, n_camera):
+        import threading
+        import queue
+
+        self.directory = directory
+        self.lock = threading.Lock()
+
+        # Frames are written by a writer thread so recording does not slow down the fetches it records
+        self.frames = queue.Queue()
+        self.writer = threading.Thread(target=self.Run, daemon=True)
+
+        os = self.ImportOS()
+
+        # Continue numbering of an existing recording
+        self.frameCount = []
+        self.latencies = []
+        for camNr in range(0, n_camera):
+            path = self.CameraPath(camNr)
+            if not os.path.exists(path):
+                print("Creating subdirectory: " + str(path))
+                os.makedirs(path)
+
+            latencies = []
+            latencyFile = os.path.join(path, "Latency.json")
+            if os.path.isfile(latencyFile):
+                with open(latencyFile, 'r') as file:
+                    latencies = self.ImportJSON().load(file)
+            self.latencies.append(latencies)
+            self.frameCount.append(len(latencies))
+
+        self.writer.start()
+        print("Recording raw frames to " + str(directory))
+
+    def ImportNumpy(self):
+        if self.np is None:
+            import numpy
+            self.np = numpy
+        return self.np
+
+    def ImportJSON(self):
+        if self.json is None:
+            import json
+            self.json = json
+        return self.json
+
+    def ImportOS(self):
+        if self.os is None:
+            import os
+            self.os = os
+        return self.os
+
+    def CameraPath(self, camNr):
+        return self.ImportOS().path.join(self.directory, "Camera" + str(camNr))
+
+    # Queue a raw frame and the time between trigger and buffer (the frame is copied, the buffer goes back to the
+    # camera once the fetch is done)
+    def Save(self, camNr, image, latency):
+        np = self.ImportNumpy()
+
+        with self.lock:
+            frameNr = self.frameCount[camNr]
+            self.frameCount[camNr] += 1
+            self.latencies[camNr].append(latency)
+
+        self.frames.put((camNr, frameNr, np.copy(image)))
+
+    # Write queued frames until Stop
+    def Run(self):
+        np = self.ImportNumpy()
+        os = self.ImportOS()
+
+        while True:
+            job = self.frames.get()
+            if job is None:
+                break
+
+            (camNr, frameNr, image) = job
+            try:
+                np.save(os.path.join(self.CameraPath(camNr), "Frame" + str(frameNr).zfill(6) + ".npy"), image)
+            except OSError as error:
+                print("Camera " + str(camNr) + ": Could not record frame " + str(frameNr) + " (" + str(error) + ")")
+
+    # Write the remaining frames and the latencies of every camera
+    def Stop(self):
+        json = self.ImportJSON()
+        os = self.ImportOS()
+
+        self.frames.put(None)
+        self.writer.join()
+
+        with self.lock:
+            for camNr in range(0, len(self.latencies)):
+                with open(os.path.join(self.CameraPath(camNr), "Latency.json"), 'w') as file:
+                    json.dump(self.latencies[camNr], file)
+        print("Recording stored in " + str(self.directory))
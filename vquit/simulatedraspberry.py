@@ -0,0 +1,277 @@
+# Simulated Raspberry Pi IO (stand-in for the pigpio module and the SSH terminal, measures lighting without the rig)
+#
+# Light pins follow their duty cycle after a rise/fall time per pin. The feedback pin drops as soon as a light pin
+# changes and rises once every changed light has settled, like the confirmation pin of the light driver.
+# Every pigpio command and SSH command waits for a configurable network round-trip.
+
+
+# Raised when pigpio rejects a command (mirrors pigpio.error)
+class SimulatedPigpioError(Exception):
+    pass
+
+
+# Stand-in for the pigpio module
+class SimulatedGPIO:
+    INPUT = 0
+    OUTPUT = 1
+
+    RISING_EDGE = 0
+    FALLING_EDGE = 1
+    EITHER_EDGE = 2
+
+    PI_SCRIPT_INITING = 0
+    PI_SCRIPT_HALTED = 1
+    PI_SCRIPT_RUNNING = 2
+
+    # pigpiod holds a limited number of scripts
+    PI_MAX_SCRIPTS = 32
+
+    error = SimulatedPigpioError
+
+    # Function runs when initializing class
+    def __init__(self, feedbackPin=0, settleTimes=None, defaultSettleTime=0.005, latency=0, daemonRunning=True,
+                 daemonStartTime=0.5):
+        from time import sleep, perf_counter
+
+        self.sleep = sleep
+        self.perf_counter = perf_counter
+
+        self.feedbackPin = feedbackPin
+        self.settleTimes = settleTimes if settleTimes is not None else {}
+        self.defaultSettleTime = defaultSettleTime
+
+        # Network round-trip of a single pigpio command in seconds and the number of commands sent
+        self.latency = latency
+        self.commands = 0
+
+        # Simulated pigpio daemon (accepts connections once started)
+        self.daemonRunning = daemonRunning
+        self.daemonStartTime = daemonStartTime
+        self.daemonReady = 0
+
+    # Connect to the simulated daemon
+    def pi(self, host=None, port=None, show_errors=True):
+        pi = SimulatedPi(self)
+        pi.connected = self.DaemonReady()
+        return pi
+
+    def DaemonReady(self):
+        return self.daemonRunning and self.perf_counter() >= self.daemonReady
+
+    def StartDaemon(self):
+        if not self.daemonRunning:
+            self.daemonRunning = True
+            self.daemonReady = self.perf_counter() + self.daemonStartTime
+
+    def StopDaemon(self):
+        self.daemonRunning = False
+
+    # Wait for a command to reach the daemon and its reply to come back
+    def RoundTrip(self):
+        self.commands += 1
+        if self.latency > 0:
+            self.sleep(self.latency)
+
+
+# Stand-in for pigpio.pi
+class SimulatedPi:
+
+    # Function runs when initializing class
+    def __init__(self, gpio):
+        import threading
+        from time import perf_counter
+
+        self.threading = threading
+        self.perf_counter = perf_counter
+
+        self.gpio = gpio
+        self.connected = True
+
+        self.modes = {}
+        self.frequencies = {}
+        self.levels = {}
+        self.dutyCycles = {}
+
+        # Stored scripts (script id: commands)
+        self.scripts = {}
+        self.scriptCount = 0
+
+        # Edge callbacks per pin and pending settle timer of the feedback pin
+        self.callbacks = {}
+        self.settleTimer = None
+        self.lock = threading.Lock()
+
+        if gpio.feedbackPin:
+            self.levels[gpio.feedbackPin] = 1
+
+    def get_current_tick(self):
+        self.gpio.RoundTrip()
+        return self.Tick()
+
+    def set_mode(self, gpio, mode):
+        self.gpio.RoundTrip()
+        self.modes[gpio] = mode
+
+    def set_PWM_frequency(self, user_gpio, frequency):
+        self.gpio.RoundTrip()
+        self.frequencies[user_gpio] = frequency
+
+    def get_PWM_frequency(self, user_gpio):
+        self.gpio.RoundTrip()
+        return self.frequencies.get(user_gpio, 800)
+
+    def set_PWM_dutycycle(self, user_gpio, dutycycle):
+        self.gpio.RoundTrip()
+        self.SetDutyCycles([(user_gpio, dutycycle)])
+
+    def write(self, gpio, level):
+        self.gpio.RoundTrip()
+        self.SetLevel(gpio, level)
+
+    def read(self, gpio):
+        self.gpio.RoundTrip()
+        return self.levels.get(gpio, 0)
+
+    # Store a script of "pwm <pin> <duty>" commands (the only script command used by RaspberryPi)
+    def store_script(self, script):
+        self.gpio.RoundTrip()
+        words = script.decode().split()
+        if len(words) % 3 != 0 or any(word.lower() != "pwm" for word in words[0::3]):
+            raise SimulatedPigpioError("Bad script")
+        if len(self.scripts) >= self.gpio.PI_MAX_SCRIPTS:
+            raise SimulatedPigpioError("No more room for scripts")
+
+        self.scriptCount += 1
+        self.scripts[self.scriptCount] = [(int(words[i + 1]), int(words[i + 2])) for i in range(0, len(words), 3)]
+        return self.scriptCount
+
+    def script_status(self, script_id):
+        self.gpio.RoundTrip()
+        return self.gpio.PI_SCRIPT_HALTED, []
+
+    def run_script(self, script_id, params=None):
+        self.gpio.RoundTrip()
+        if script_id not in self.scripts:
+            raise SimulatedPigpioError("Unknown script id")
+        self.SetDutyCycles(self.scripts[script_id])
+
+    def delete_script(self, script_id):
+        self.gpio.RoundTrip()
+        self.scripts.pop(script_id, None)
+
+    # Register an edge callback (func(gpio, level, tick))
+    def callback(self, user_gpio, edge=0, func=None):
+        self.gpio.RoundTrip()
+        callback = SimulatedCallback(self, user_gpio, edge, func)
+        self.callbacks.setdefault(user_gpio, []).append(callback)
+        return callback
+
+    def stop(self):
+        if self.settleTimer is not None:
+            self.settleTimer.cancel()
+        self.connected = False
+
+    # Apply duty cycles at once, the feedback pin confirms once the slowest changed light has settled
+    def SetDutyCycles(self, pins):
+        settleTime = None
+        for (pin, dutyCycle) in pins:
+            if self.dutyCycles.get(pin, 0) != dutyCycle:
+                self.dutyCycles[pin] = dutyCycle
+                pinSettleTime = self.gpio.settleTimes.get(pin, self.gpio.defaultSettleTime)
+                settleTime = pinSettleTime if settleTime is None else max(settleTime, pinSettleTime)
+
+        if settleTime is None or not self.gpio.feedbackPin:
+            return
+
+        with self.lock:
+            if self.settleTimer is not None:
+                self.settleTimer.cancel()
+            self.SetLevel(self.gpio.feedbackPin, 0)
+            self.settleTimer = self.threading.Timer(settleTime, self.SetLevel, [self.gpio.feedbackPin, 1])
+            self.settleTimer.daemon = True
+            self.settleTimer.start()
+
+    # Time in microseconds like pigpio
+    def Tick(self):
+        return int(self.perf_counter() * 1000000) & 0xFFFFFFFF
+
+    def SetLevel(self, pin, level):
+        if self.levels.get(pin, 0) == level:
+            return
+        self.levels[pin] = level
+
+        # Notify callbacks
+        tick = self.Tick()
+        for callback in list(self.callbacks.get(pin, [])):
+            callback.Notify(level, tick)
+
+
+# Stand-in for the callback objects of pigpio
+class SimulatedCallback:
+    def __init__(self, pi, user_gpio, edge, func):
+        self.pi = pi
+        self.gpio = user_gpio
+        self.edge = edge
+        self.func = func
+
+    def Notify(self, level, tick):
+        if self.edge == SimulatedGPIO.EITHER_EDGE or (self.edge == SimulatedGPIO.RISING_EDGE) == (level == 1):
+            self.func(self.gpio, level, tick)
+
+    def cancel(self):
+        callbacks = self.pi.callbacks.get(self.gpio, [])
+        if self in callbacks:
+            callbacks.remove(self)
+
+
+# Stand-in for the SSH class of vquit.raspberry (runs the daemon commands used by RaspberryPi on SimulatedGPIO)
+class SimulatedSSH:
+
+    # Function runs when initializing class
+    def __init__(self, gpio, handshake=0.3, latency=0.01, persistent=False):
+        self.gpio = gpio
+        self.handshake = handshake
+        self.latency = latency
+        self.persistent = persistent
+        self.connected = False
+
+        # Commands sent during this session
+        self.commands = []
+
+    def __enter__(self):
+        self.Connect()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if not self.persistent:
+            self.Close()
+
+    def Connected(self):
+        return self.connected
+
+    def Connect(self):
+        if not self.connected:
+            self.gpio.sleep(self.handshake)
+            self.connected = True
+
+    def Close(self):
+        self.connected = False
+
+    def Send(self, command, printReturn=None):
+        self.Run(command)
+        return [], []
+
+    # Run a command and return its exit status (127 for commands the simulation does not know)
+    def Run(self, command):
+        self.gpio.sleep(self.latency)
+        self.commands.append(command)
+
+        if command == "sudo pigpiod":
+            self.gpio.StartDaemon()
+        elif command in ["sudo killall pigpiod", "sudo shutdown -h now"]:
+            self.gpio.StopDaemon()
+        elif command == "pidof pigpiod":
+            return 0 if self.gpio.daemonRunning else 1
+        else:
+            return 127
+        return 0